@@ -0,0 +1,114 @@
+import os
+import hashlib
+from pathlib import Path
+import numpy as np
+import librosa
+import soundfile as sf
+from core.instrumentation import span
+
+CACHE_DIR_NAME = ".decoded"
+HASH_DIR_NAME = ".hashes"
+MAX_CACHE_BYTES = 2 * 1024 ** 3  # per cache directory
+
+def _hash_record_path(path):
+    path = Path(path).resolve()
+    stat = path.stat()
+    key = hashlib.sha1(f"{path}|{stat.st_mtime_ns}|{stat.st_size}".encode()).hexdigest()[:16]
+    return path.parent / HASH_DIR_NAME / f"{path.name}.{key}"
+
+def register_content_hash(path, digest):
+    """
+    Records a SHA-256 computed while the file was written (e.g. during upload), so
+    content_hash() returns it without reading the file. The record is keyed by path,
+    mtime and size and goes stale as soon as the file changes.
+    """
+    record = _hash_record_path(path)
+    record.parent.mkdir(parents=True, exist_ok=True)
+    record.write_text(digest)
+
+def unregister_content_hash(path):
+    """Drops the record of register_content_hash; call it before deleting the file."""
+    _hash_record_path(path).unlink(missing_ok=True)
+
+def content_hash(path, chunk_size=1 << 20):
+    """
+    SHA-256 of the file contents, for caches that must survive renames and re-uploads.
+    """
+    record = _hash_record_path(path)
+    if record.exists():
+        return record.read_text().strip()
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def probe_audio(path):
+    """
+    Reads duration (s), sample rate and channel count from the file header without
+    decoding the audio. Returns None if neither libsndfile nor audioread can open it.
+    """
+    try:
+        info = sf.info(str(path))
+        return {"duration": info.duration, "sample_rate": info.samplerate, "channels": info.channels}
+    except Exception:
+        pass
+    try:
+        import audioread
+        with audioread.audio_open(str(path)) as f:
+            return {"duration": f.duration, "sample_rate": f.samplerate, "channels": f.channels}
+    except Exception:
+        return None
+
+def _cache_path(audio_path, sr, mono, cache_dir):
+    audio_path = Path(audio_path).resolve()
+    stat = audio_path.stat()
+    key = hashlib.sha1(f"{audio_path}|{stat.st_mtime_ns}|{stat.st_size}|{sr}|{mono}".encode()).hexdigest()[:16]
+    cache_dir = Path(cache_dir) if cache_dir else audio_path.parent / CACHE_DIR_NAME
+    return cache_dir / f"{audio_path.stem}.{key}.npy"
+
+def _evict(cache_dir, max_bytes):
+    # Other workers share the directory, so entries may vanish at any point here
+    entries = []
+    for path in cache_dir.glob("*.npy"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort(key=lambda e: e[0])
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in entries:
+        if total <= max_bytes:
+            break
+        total -= size
+        entry.unlink(missing_ok=True)
+
+def load_audio(audio_path, sr=44100, mono=True, cache_dir=None, max_bytes=MAX_CACHE_BYTES):
+    """
+    Drop-in for librosa.load(audio_path, sr=sr) backed by a decoded-audio cache.
+    Float32 PCM is stored as a .npy file keyed by path, mtime and sample rate
+    (in a .decoded/ directory next to the audio by default) and returned as a
+    read-only memory map, so later stages skip decoding and resampling.
+    The directory is trimmed to max_bytes, least recently used first.
+    """
+    npy_path = _cache_path(audio_path, sr, mono, cache_dir)
+    try:
+        os.utime(npy_path)  # mark as recently used
+        return np.load(npy_path, mmap_mode='r'), sr
+    except FileNotFoundError:
+        pass  # not cached, or evicted by another worker: decode again
+
+    with span("decode"):
+        y, sr = librosa.load(audio_path, sr=sr, mono=mono)
+    npy_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = npy_path.with_name(f"{npy_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.ascontiguousarray(y, dtype=np.float32))
+    os.replace(tmp_path, npy_path)
+    _evict(npy_path.parent, max_bytes)
+
+    try:
+        return np.load(npy_path, mmap_mode='r'), sr
+    except FileNotFoundError:  # larger than the whole budget, or already evicted by another worker
+        return y, sr
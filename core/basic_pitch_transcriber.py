@@ -1,6 +1,10 @@
 import os
+import json
+import uuid
+import functools
 import numpy as np
 from scipy.io import wavfile
+from core.instrumentation import span, report_progress
 
 def is_available():
     try:
@@ -10,6 +14,97 @@ def is_available():
         return False
 
 
+@functools.lru_cache(maxsize=1)
+def load_basic_pitch_model():
+    """
+    Loads the Basic Pitch network once per worker process. Older basic-pitch releases
+    have no Model class; predict() then gets the model path and loads it itself.
+    """
+    from basic_pitch import ICASSP_2022_MODEL_PATH
+    try:
+        from basic_pitch.inference import Model
+    except ImportError:
+        return ICASSP_2022_MODEL_PATH
+    return Model(ICASSP_2022_MODEL_PATH)
+
+def basic_pitch_note_events(input_paths):
+    """
+    Runs Basic Pitch over many audio files (an album, all stems of a song) with one
+    warm model. Returns {input_path: note_events}.
+    """
+    from basic_pitch.inference import predict
+    model = load_basic_pitch_model()
+    results = {}
+    for i, input_path in enumerate(input_paths):
+        with span("basic_pitch"):
+            _, _, note_events = predict(input_path, model)
+        results[input_path] = note_events
+        report_progress((i + 1) / len(input_paths), f"Transcribed {os.path.basename(input_path)}")
+    return results
+
+# Compact note storage: 13 bytes per note instead of a rendered 44.1 kHz waveform
+NOTE_DTYPE = np.dtype([("start", "<f4"), ("end", "<f4"), ("pitch", "u1"), ("amp", "<f4")])
+
+def notes_to_array(note_events):
+    """
+    Packs (start_s, end_s, pitch, amp, ...) note events into a NOTE_DTYPE structured array.
+    """
+    if isinstance(note_events, np.ndarray):
+        return note_events.astype(NOTE_DTYPE, copy=False)
+    return np.array([tuple(event[:4]) for event in note_events], dtype=NOTE_DTYPE)
+
+def notes_to_json(note_events):
+    return [{"start": float(n["start"]), "end": float(n["end"]), "pitch": int(n["pitch"]), "amp": float(n["amp"])}
+            for n in notes_to_array(note_events)]
+
+def write_midi(note_events, output_path, program=0):
+    """
+    Writes note events as a single-track standard MIDI file; amp (0-1) becomes velocity.
+    """
+    import pretty_midi
+    midi = pretty_midi.PrettyMIDI()
+    instrument = pretty_midi.Instrument(program=program)
+    for n in notes_to_array(note_events):
+        velocity = int(np.clip(round(float(n["amp"]) * 127), 1, 127))
+        instrument.notes.append(pretty_midi.Note(velocity=velocity, pitch=int(n["pitch"]),
+                                                 start=float(n["start"]), end=float(n["end"])))
+    midi.instruments.append(instrument)
+    midi.write(str(output_path))
+
+def save_notes(note_events, output_path):
+    """
+    Stores note events in the format given by the extension: .npy (NOTE_DTYPE array),
+    .json (list of {start, end, pitch, amp}) or .mid/.midi.
+    """
+    ext = os.path.splitext(str(output_path))[1].lower()
+    if ext == ".npy":
+        np.save(output_path, notes_to_array(note_events))
+    elif ext == ".json":
+        with open(output_path, "w") as f:
+            json.dump(notes_to_json(note_events), f)
+    elif ext in (".mid", ".midi"):
+        write_midi(note_events, output_path)
+    else:
+        raise ValueError(f"Unsupported note format: {ext}")
+    return os.path.abspath(output_path)
+
+def load_notes(notes_path):
+    """
+    Reads notes written by save_notes back as a NOTE_DTYPE array.
+    """
+    ext = os.path.splitext(str(notes_path))[1].lower()
+    if ext == ".npy":
+        return np.load(notes_path).astype(NOTE_DTYPE, copy=False)
+    if ext == ".json":
+        with open(notes_path) as f:
+            return notes_to_array([(n["start"], n["end"], n["pitch"], n["amp"]) for n in json.load(f)])
+    if ext in (".mid", ".midi"):
+        import pretty_midi
+        midi = pretty_midi.PrettyMIDI(str(notes_path))
+        return notes_to_array(sorted((n.start, n.end, n.pitch, n.velocity / 127.0)
+                                     for instrument in midi.instruments for n in instrument.notes))
+    raise ValueError(f"Unsupported note format: {ext}")
+
 def midi_to_freq(midi_pitch):
     return 440.0 * (2.0 ** ((midi_pitch - 69.0) / 12.0))
 
@@ -24,42 +119,88 @@ def generate_sine_wave(frequency, duration, sample_rate=44100, amplitude=0.3):
         wave *= envelope
     return wave
 
-def basic_pitch_transcribe(input_path, output_path):
+def render_notes(note_events, sample_rate=44100, amplitude=0.2, total_samples=None):
     """
-    Transcribes audio to midi and then synthesizes a sine wave version.
-    Returns the absolute path to the generated WAV file.
+    Renders (start_s, end_s, pitch, amp, ...) note events as faded sine tones into one
+    float32 buffer (by default 0.5 s longer than the last note). Notes are grouped by
+    pitch: every note starts at phase 0, so each pitch's sine is computed once for its
+    longest note and its notes reuse a prefix of it. Per note, the work is an in-place
+    multiply-add with the shared fade envelope; tails past the buffer end are clipped.
     """
-    from basic_pitch.inference import predict
-    _, _, note_events = predict(input_path)
-    
-    if not note_events:
-        return None
-
-    max_time = max(note[1] for note in note_events)
-    sample_rate = 44100
-    total_samples = int((max_time + 0.5) * sample_rate)
+    notes = {}
+    for start_s, end_s, pitch, amp, *_ in note_events:
+        length = int(sample_rate * (end_s - start_s))
+        if end_s - start_s > 0 and length > 0:
+            notes.setdefault(pitch, []).append((int(start_s * sample_rate), length, amp * amplitude))
+    if total_samples is None:
+        total_samples = int((max(note[1] for note in note_events) + 0.5) * sample_rate) if len(note_events) else 0
     song_buffer = np.zeros(total_samples, dtype=np.float32)
+    if not notes:
+        return song_buffer
+
+    fade_len = int(sample_rate * 0.005)
+    fade_in = np.linspace(0, 1, fade_len, dtype=np.float32)
+    fade_out = fade_in[::-1]
+    scratch = np.empty(max(length for group in notes.values() for _, length, _ in group), dtype=np.float32)
+
+    for pitch, group in notes.items():
+        longest = max(length for _, length, _ in group)
+        phase_table = np.sin(2 * np.pi * midi_to_freq(pitch) * np.arange(longest) / sample_rate).astype(np.float32)
+        for start, length, amp in group:
+            n = min(length, total_samples - start)
+            if n <= 0:
+                continue
+            wave = np.multiply(phase_table[:n], amp, out=scratch[:n])
+            if length > fade_len * 2:
+                wave[:fade_len] *= fade_in[:n]
+                if n > length - fade_len:
+                    wave[length - fade_len:] *= fade_out[:n - (length - fade_len)]
+            song_buffer[start:start + n] += wave
+    return song_buffer
+
+def synthesize_notes(note_events, output_path, sample_rate=44100):
+    """
+    Renders note events (or a stored notes file) to a normalized sine-wave WAV.
+    Returns the absolute path to the WAV file, or None if there are no notes.
+    """
+    if isinstance(note_events, (str, os.PathLike)):
+        note_events = load_notes(note_events)
+    if not len(note_events):
+        return None
 
-    for note in note_events:
-        start_s, end_s, pitch, amp, bend = note
-        duration = end_s - start_s
-        if duration <= 0:
-            continue
-            
-        freq = midi_to_freq(pitch)
-        wave = generate_sine_wave(freq, duration, sample_rate, amplitude=amp * 0.2)
-        
-        start_sample = int(start_s * sample_rate)
-        end_sample = start_sample + len(wave)
-        
-        if end_sample <= len(song_buffer):
-            song_buffer[start_sample:end_sample] += wave
+    with span("synthesis"):
+        song_buffer = render_notes(note_events, sample_rate, amplitude=0.2)
 
     max_val = np.max(np.abs(song_buffer))
     if max_val > 0:
         song_buffer = song_buffer / max_val * 0.8
 
     wav_data = (song_buffer * 32767).astype(np.int16)
-    wavfile.write(output_path, sample_rate, wav_data)
+    # Readers may serve output_path as soon as it exists, so it only ever appears complete
+    tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        wavfile.write(tmp_path, sample_rate, wav_data)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
     
     return os.path.abspath(output_path)
+
+def basic_pitch_notes(input_path, output_paths=()):
+    """
+    Transcribes audio to note events without synthesizing anything.
+    Saves them to each of output_paths (see save_notes) and returns a NOTE_DTYPE array.
+    """
+    notes = notes_to_array(basic_pitch_note_events([input_path])[input_path])
+    with span("note_export"):
+        for output_path in output_paths:
+            save_notes(notes, output_path)
+    return notes
+
+def basic_pitch_transcribe(input_path, output_path):
+    """
+    Transcribes audio to midi and then synthesizes a sine wave version.
+    Returns the absolute path to the generated WAV file.
+    """
+    return synthesize_notes(basic_pitch_notes(input_path), output_path)
@@ -0,0 +1,24 @@
+import librosa
+import numpy as np
+from core.instrumentation import span
+
+def track_beats(audio, sr=44100, hop_size=2048, tempo=None):
+    """
+    Computes the onset strength envelope once and tracks beats on it.
+    A known tempo (BPM) skips tempo estimation. Returns (tempo, beat_frames).
+    """
+    with span("beat_tracking"):
+        onset_env = librosa.onset.onset_strength(y=audio, sr=sr, hop_length=hop_size, aggregate=np.median)
+        return librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_size, bpm=tempo)
+
+def analyze_beats(audio, sr=44100, hop_size=2048):
+    """
+    Lightweight beat/tempo analysis of already decoded audio, without chord recognition.
+    Returns a dictionary with beat times in seconds and the tempo in BPM.
+    """
+    tempo, beat_frames = track_beats(audio, sr=sr, hop_size=hop_size)
+    beat_times = librosa.frames_to_time(beat_frames, sr=sr, hop_length=hop_size)
+    return {
+        'beats': beat_times.tolist(),
+        'tempo': float(np.atleast_1d(tempo)[0])
+    }
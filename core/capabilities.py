@@ -0,0 +1,45 @@
+import time
+import threading
+from core import basic_pitch_transcriber, demucs_source_separator, nnls_chord_transcriber, \
+    vamp_chord_transcriber, whisper_lyrics_transcriber
+
+CAPABILITY_TTL = 300.0  # seconds
+
+# Backend name -> is_available probe (whisper returns (available, model dir or message))
+PROBES = {
+    'demucs': demucs_source_separator.is_available,
+    'whisper': whisper_lyrics_transcriber.is_available,
+    'nnls': nnls_chord_transcriber.is_available,
+    'vamp': vamp_chord_transcriber.is_available,
+    'basic_pitch': basic_pitch_transcriber.is_available,
+}
+
+_cache = {}  # name -> (expires at, probe result)
+_lock = threading.Lock()
+
+def capability(name, ttl=CAPABILITY_TTL):
+    """
+    Result of the backend's is_available() probe, cached for ttl seconds so frequently
+    polled status endpoints do not repeat PATH walks and heavy imports.
+    """
+    now = time.monotonic()
+    entry = _cache.get(name)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    with _lock:
+        entry = _cache.get(name)
+        if entry is None or entry[0] <= now:
+            entry = (now + ttl, PROBES[name]())
+            _cache[name] = entry
+        return entry[1]
+
+def refresh(name=None):
+    """Drops cached probe results (one backend, or all) so the next lookup probes again."""
+    with _lock:
+        if name is None:
+            _cache.clear()
+        else:
+            _cache.pop(name, None)
+
+def capabilities(ttl=CAPABILITY_TTL):
+    return {name: capability(name, ttl) for name in PROBES}
@@ -1,33 +1,203 @@
+import os
+import json
+import time
+import uuid
 import shutil
+import hashlib
+import functools
 import subprocess
 from pathlib import Path
+from core.audio_cache import content_hash
+from core.instrumentation import span, report_progress
+
+MAX_STEM_CACHE_BYTES = 20 * 1024 ** 3
+# Separations are written to <key>.<id>.tmp and renamed into place when complete; work
+# folders older than this were left by a killed worker
+STALE_WORK_SECONDS = 6 * 3600
+
+# Quality/speed trade-offs; "fast" skips the random-shift pass and overlaps chunks less
+DEMUCS_PRESETS = {
+    "default": {"shifts": 1, "overlap": 0.25, "segment": None},
+    "fast": {"shifts": 0, "overlap": 0.1, "segment": None},
+}
+
+def engine_available():
+    try:
+        import demucs.apply
+        import demucs.pretrained
+        return True
+    except ImportError:
+        return False
 
 def is_available():
-    return shutil.which("demucs") is not None
+    return engine_available() or shutil.which("demucs") is not None
 
-def demucs_source_separate(input_path, media_root, model_name="htdemucs"):
+@functools.lru_cache(maxsize=2)
+def load_demucs_model(model_name="htdemucs"):
+    """
+    Loads pretrained Demucs weights once per worker process and keeps them warm.
+    """
+    from demucs.pretrained import get_model
+    model = get_model(model_name)
+    model.eval()
+    return model
+
+def resolve_demucs_options(preset="default", segment=None, overlap=None, shifts=None):
+    """
+    Preset settings with any explicitly given segment/overlap/shifts on top.
+    """
+    if preset not in DEMUCS_PRESETS:
+        raise ValueError(f"Unknown Demucs preset: {preset}")
+    options = dict(DEMUCS_PRESETS[preset])
+    for name, value in (("segment", segment), ("overlap", overlap), ("shifts", shifts)):
+        if value is not None:
+            options[name] = value
+    return options
+
+def _separate_in_process(input_path, stem_dir, model_name, options, threads=None, jobs=None):
+    """
+    Same as `demucs -n <model> --two-stems vocals`, run on tensors with a warm model.
+    """
+    import torch
+    from demucs.apply import apply_model
+    from demucs.audio import save_audio
+    from demucs.separate import load_track
+
+    # set_num_threads is process-wide: restore it so later work in this worker is unaffected
+    previous_threads = torch.get_num_threads()
+    if threads:
+        torch.set_num_threads(threads)
+    try:
+        with span("demucs_model"):
+            model = load_demucs_model(model_name)
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        with span("decode"):
+            wav = load_track(input_path, model.audio_channels, model.samplerate)
+        ref = wav.mean(0)
+        wav = (wav - ref.mean()) / ref.std()
+        report_progress(0.1, "Separating stems")
+        with span("demucs"), torch.no_grad():
+            sources = apply_model(model, wav[None], device=device, shifts=options["shifts"], split=True,
+                                  overlap=options["overlap"], segment=options["segment"],
+                                  num_workers=jobs or 0, progress=False)[0]
+        sources = sources * ref.std() + ref.mean()
+        report_progress(0.9, "Saving stems")
+
+        vocals_idx = model.sources.index("vocals")
+        no_vocals = sum(source for i, source in enumerate(sources) if i != vocals_idx)
+        stem_dir.mkdir(parents=True, exist_ok=True)
+        with span("save_stems"):
+            save_audio(sources[vocals_idx], str(stem_dir / "vocals.wav"), samplerate=model.samplerate)
+            save_audio(no_vocals, str(stem_dir / "no_vocals.wav"), samplerate=model.samplerate)
+    finally:
+        torch.set_num_threads(previous_threads)
+
+def stem_cache_key(input_path, model_name, options=None):
+    """
+    Content-addressed key for a separation: same audio, model and options -> same stems,
+    whatever the upload was called.
+    """
+    payload = json.dumps({"audio": content_hash(input_path), "model": model_name, "options": options or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+def _dir_size(path):
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+def evict_stems(output_dir, max_bytes=MAX_STEM_CACHE_BYTES, keep=None):
+    """
+    Deletes least recently used stem folders under separated/<model>/ until the total
+    fits max_bytes. Folders are touched on every cache hit, so mtime is the last access.
+    Work folders of separations in progress are left alone unless they are stale.
+    """
+    entries = []
+    for d in Path(output_dir).glob("*/*"):
+        if not d.is_dir():
+            continue
+        if d.suffix == ".tmp":
+            if time.time() - d.stat().st_mtime > STALE_WORK_SECONDS:
+                shutil.rmtree(d, ignore_errors=True)
+            continue
+        entries.append(d)
+    entries.sort(key=lambda d: d.stat().st_mtime)
+    sizes = {d: _dir_size(d) for d in entries}
+    total = sum(sizes.values())
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        if keep is not None and entry == Path(keep):
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= sizes[entry]
+
+def _publish_stems(work_dir, stem_dir):
+    """
+    Moves a finished separation into the cache with one rename, so other workers never
+    see a folder with half-written stems. Another worker may have published the same
+    key first; its stems are as good as ours.
+    """
+    if stem_dir.exists() and not all((stem_dir / f"{stem}.wav").exists() for stem in ("vocals", "no_vocals")):
+        shutil.rmtree(stem_dir, ignore_errors=True)  # left incomplete by an older version
+    try:
+        os.rename(work_dir, stem_dir)
+    except OSError:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def demucs_source_separate(input_path, media_root, model_name="htdemucs", preset="default", threads=None, jobs=None,
+                           segment=None, overlap=None, shifts=None, max_cache_bytes=MAX_STEM_CACHE_BYTES):
     """
     Uses Demucs to separate vocals from the track.
     CMD: demucs -n <model> --two-stems vocals "song.mp3" -o data/separated/
+    preset picks shifts/overlap/segment (see DEMUCS_PRESETS); explicit values override it.
+    threads caps torch/OpenMP threads and jobs sets Demucs parallel jobs, so several
+    workers can share a CPU node; segment must stay within the model's limit.
+    Stems are stored under separated/<model>/<content key>/ and reused when the same
+    audio is separated again with the same settings. Runs in-process on a warm model
+    when the demucs Python API is importable, otherwise falls back to the CLI.
     """
     media_root = Path(media_root)
     output_dir = media_root / "separated"
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    cmd = [
-        "demucs",
-        "-n", model_name,
-        "--two-stems", "vocals",
-        str(input_path),
-        "-o", str(output_dir)
-    ]
-    
     try:
-        subprocess.run(cmd, check=True)
-        filename_stem = Path(input_path).stem
-        # Demucs creates a folder based on model name
-        vocals_path = output_dir / model_name / filename_stem / "vocals.wav"
-        no_vocals_path = output_dir / model_name / filename_stem / "no_vocals.wav"
+        options = resolve_demucs_options(preset, segment=segment, overlap=overlap, shifts=shifts)
+        with span("stem_cache_key"):
+            key = stem_cache_key(input_path, model_name, {"two_stems": "vocals", **options})
+        stem_dir = output_dir / model_name / key
+        vocals_path = stem_dir / "vocals.wav"
+        no_vocals_path = stem_dir / "no_vocals.wav"
+
+        # Stem folders only appear complete (see _publish_stems), so both files mean a hit
+        if vocals_path.exists() and no_vocals_path.exists():
+            os.utime(stem_dir)  # mark as recently used
+        else:
+            work_dir = stem_dir.with_name(f"{key}.{uuid.uuid4().hex}.tmp")
+            try:
+                if engine_available():
+                    _separate_in_process(input_path, work_dir, model_name, options, threads=threads, jobs=jobs)
+                else:
+                    cmd = [
+                        "demucs",
+                        "-n", model_name,
+                        "--two-stems", "vocals",
+                        "--filename", work_dir.name + "/{stem}.{ext}",
+                        "--shifts", str(options["shifts"]),
+                        "--overlap", str(options["overlap"]),
+                    ]
+                    if options["segment"] is not None:
+                        cmd += ["--segment", str(options["segment"])]
+                    if jobs:
+                        cmd += ["-j", str(jobs)]
+                    cmd += [str(input_path), "-o", str(output_dir)]
+                    env = None
+                    if threads:
+                        env = {**os.environ, "OMP_NUM_THREADS": str(threads), "MKL_NUM_THREADS": str(threads)}
+                    report_progress(0.1, "Separating stems (demucs CLI)")
+                    with span("demucs_cli"):
+                        subprocess.run(cmd, check=True, env=env)
+                _publish_stems(work_dir, stem_dir)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)  # only still there if separation failed
+            evict_stems(output_dir, max_cache_bytes, keep=stem_dir)
         
         return {
             "vocals": str(vocals_path) if vocals_path.exists() else None,
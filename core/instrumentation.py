@@ -0,0 +1,61 @@
+import time
+import contextlib
+import contextvars
+
+# The recorder of the work running in this thread/task; None means instrumentation is off
+_current = contextvars.ContextVar("recorder", default=None)
+
+class Recorder:
+    """
+    Collects timing spans, and forwards sub-progress, for one unit of work (a pipeline
+    stage). Spans are {name, start, duration, depth} in seconds since recording began.
+    """
+    def __init__(self, on_progress=None):
+        self.on_progress = on_progress
+        self.spans = []
+        self.origin = time.perf_counter()
+        self.depth = 0
+
+    def totals(self):
+        totals = {}
+        for s in self.spans:
+            totals[s["name"]] = totals.get(s["name"], 0.0) + s["duration"]
+        return totals
+
+@contextlib.contextmanager
+def recording(on_progress=None):
+    """
+    Activates a Recorder for the enclosed code. on_progress(fraction, message) receives
+    the stage's report_progress calls.
+    """
+    recorder = Recorder(on_progress)
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current.reset(token)
+
+@contextlib.contextmanager
+def span(name):
+    """
+    Times the enclosed block into the active recorder. A no-op outside recording(),
+    so core functions can be instrumented unconditionally.
+    """
+    recorder = _current.get()
+    if recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    recorder.depth += 1
+    try:
+        yield
+    finally:
+        recorder.depth -= 1
+        recorder.spans.append({"name": name, "start": round(start - recorder.origin, 6),
+                               "duration": round(time.perf_counter() - start, 6), "depth": recorder.depth})
+
+def report_progress(fraction, message=None):
+    """Reports how far (0-1) the current stage has got, if anyone is listening."""
+    recorder = _current.get()
+    if recorder is not None and recorder.on_progress is not None:
+        recorder.on_progress(min(max(float(fraction), 0.0), 1.0), message)
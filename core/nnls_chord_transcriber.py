@@ -19,11 +19,17 @@ python transcribe_chords.py input_audio.wav [output_chords.json]
 import os
 import sys
 import json
+import functools
+import collections
 import warnings
 import numpy as np
 import librosa
+import soundfile as sf
 from scipy.optimize import nnls
 from scipy.ndimage import uniform_filter1d
+from core.beat_tracker import track_beats
+from core.audio_cache import load_audio
+from core.instrumentation import span, report_progress
 
 warnings.filterwarnings('ignore')
 
@@ -61,76 +67,103 @@ aug=1,0,0,0,0,0,0,0,0,0,0,0,1,0,0,0,1,0,0,0,1,0,0,0
 7=0,0,0,0,1,0,0,0,0,0,0,0,1,0,0,0,1,0,0,1,0,0,1,0
 """
 
+@functools.lru_cache(maxsize=16)
+def load_chord_dict(chord_dict_raw=CHORD_DICT_RAW):
+    """
+    Parses, transposes and normalizes a chord dictionary into a read-only
+    (n_chords x 24) template bank. Built once per process for each dictionary.
+    """
+    base_templates = []
+    base_names = []
+    for line in chord_dict_raw.strip().split('\n'):
+        line = line.strip()
+        if not line or line.startswith('#') or '=' not in line:
+            continue
+        chord_name, values_str = line.split('=', 1)
+        values = [int(x) for x in values_str.split(',')]
+        if len(values) == 24:
+            base_templates.append(np.array(values, dtype=float))
+            base_names.append(chord_name)
+
+    all_templates = []
+    all_names = []
+    note_names = ['A', 'A#', 'B', 'C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#']
+    
+    for template_idx, base_template in enumerate(base_templates):
+        chord_type = base_names[template_idx]
+        for semitone in range(12):
+            transposed = np.zeros(24)
+            for k in range(12):
+                transposed[k] = base_template[(k - semitone + 12) % 12]
+                transposed[k + 12] = base_template[((k - semitone + 12) % 12) + 12]
+            
+            root_note = note_names[semitone]
+            root_idx = semitone % 12
+            bass_idx = -1
+            for k in range(12):
+                if transposed[k] > 0.99:
+                    bass_idx = k
+                    break
+            
+            chord_name = root_note + chord_type
+            if bass_idx != -1 and bass_idx != root_idx:
+                chord_name += "/" + note_names[bass_idx]
+            
+            all_templates.append(transposed)
+            all_names.append(chord_name)
+    
+    # Add N (no chord)
+    n_template = np.zeros(24)
+    for k in range(12):
+        n_template[k] = 0.5
+        n_template[k + 12] = 1.0
+    all_templates.append(n_template)
+    all_names.append('N')
+    
+    normalized_templates = []
+    for i, template in enumerate(all_templates):
+        stand = np.power(np.sum(np.power(np.abs(template), 2.0)) / 24.0, 0.5)
+        if all_names[i] == 'N': stand /= 1.1
+        normalized_templates.append(template / stand if stand > 0 else template)
+    
+    templates = np.array(normalized_templates)
+    templates.setflags(write=False)
+    return templates, tuple(all_names)
+
+@functools.lru_cache(maxsize=16)
+def get_chord_transcriber(sample_rate=44100, hop_size=2048, chord_dict_raw=CHORD_DICT_RAW, dtype=np.float64):
+    """
+    Returns a process-wide shared ChordTranscriber for these settings.
+    """
+    return ChordTranscriber(sample_rate=sample_rate, hop_size=hop_size, chord_dict_raw=chord_dict_raw, dtype=dtype)
+
 class ChordTranscriber:
-    def __init__(self, sample_rate=44100, hop_size=2048):
+    def __init__(self, sample_rate=44100, hop_size=2048, chord_dict_raw=CHORD_DICT_RAW, dtype=np.float64):
+        """
+        dtype=np.float32 opts into single precision from chroma extraction through
+        template matching and decoding (half the memory on long recordings).
+        """
         self.sr = sample_rate
         self.hop_size = hop_size
-        self.chord_templates, self.chord_names = self._load_chord_dict()
-        
-    def _load_chord_dict(self):
-        base_templates = []
-        base_names = []
-        for line in CHORD_DICT_RAW.strip().split('\n'):
-            line = line.strip()
-            if not line or line.startswith('#') or '=' not in line:
-                continue
-            chord_name, values_str = line.split('=', 1)
-            values = [int(x) for x in values_str.split(',')]
-            if len(values) == 24:
-                base_templates.append(np.array(values, dtype=float))
-                base_names.append(chord_name)
-
-        all_templates = []
-        all_names = []
-        note_names = ['A', 'A#', 'B', 'C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#']
-        
-        for template_idx, base_template in enumerate(base_templates):
-            chord_type = base_names[template_idx]
-            for semitone in range(12):
-                transposed = np.zeros(24)
-                for k in range(12):
-                    transposed[k] = base_template[(k - semitone + 12) % 12]
-                    transposed[k + 12] = base_template[((k - semitone + 12) % 12) + 12]
-                
-                root_note = note_names[semitone]
-                root_idx = semitone % 12
-                bass_idx = -1
-                for k in range(12):
-                    if transposed[k] > 0.99:
-                        bass_idx = k
-                        break
-                
-                chord_name = root_note + chord_type
-                if bass_idx != -1 and bass_idx != root_idx:
-                    chord_name += "/" + note_names[bass_idx]
-                
-                all_templates.append(transposed)
-                all_names.append(chord_name)
-        
-        # Add N (no chord)
-        n_template = np.zeros(24)
-        for k in range(12):
-            n_template[k] = 0.5
-            n_template[k + 12] = 1.0
-        all_templates.append(n_template)
-        all_names.append('N')
-        
-        normalized_templates = []
-        for i, template in enumerate(all_templates):
-            stand = np.power(np.sum(np.power(np.abs(template), 2.0)) / 24.0, 0.5)
-            if all_names[i] == 'N': stand /= 1.1
-            normalized_templates.append(template / stand if stand > 0 else template)
-        
-        return normalized_templates, all_names
+        self.dtype = np.dtype(dtype)
+        self.chord_templates, self.chord_names = load_chord_dict(chord_dict_raw)
+        if self.chord_templates.dtype != self.dtype:
+            self.chord_templates = self.chord_templates.astype(self.dtype)
+            self.chord_templates.setflags(write=False)
+        self.n_idx = self.chord_names.index('N')
+        self.n_weight = 0.6
 
     def extract_chroma(self, audio):
         bins_per_octave = 36
-        cqt_treble = np.abs(librosa.cqt(y=audio, sr=self.sr, hop_length=self.hop_size,
-                                      fmin=librosa.note_to_hz('C2'), n_bins=bins_per_octave * 4,
-                                      bins_per_octave=bins_per_octave))
-        cqt_bass = np.abs(librosa.cqt(y=audio, sr=self.sr, hop_length=self.hop_size,
-                                    fmin=librosa.note_to_hz('C1'), n_bins=bins_per_octave * 2,
-                                    bins_per_octave=bins_per_octave))
+        # One CQT over C1-B5 serves both ranges: bass is C1-B2, treble is C2-B5
+        with span("cqt"):
+            # Only narrow the input: widening float32 audio would run the CQT in complex128
+            if self.dtype == np.float32:
+                audio = audio.astype(np.float32, copy=False)
+            cqt = np.abs(librosa.cqt(y=audio, sr=self.sr, hop_length=self.hop_size,
+                                     fmin=librosa.note_to_hz('C1'), n_bins=bins_per_octave * 5,
+                                     bins_per_octave=bins_per_octave)).astype(self.dtype, copy=False)
+        cqt_bass, cqt_treble = cqt[:bins_per_octave * 2], cqt[bins_per_octave:]
 
         def whiten(cqt_data):
             window = 37
@@ -140,64 +173,136 @@ class ChordTranscriber:
             sigma = np.sqrt(np.maximum(sq_mu - mu**2, 1e-10))
             return diff / (sigma + 1e-10)
 
-        cqt_treble, cqt_bass = whiten(cqt_treble), whiten(cqt_bass)
+        with span("whiten"):
+            cqt_treble, cqt_bass = whiten(cqt_treble), whiten(cqt_bass)
 
         def collapse(whitened):
-            chroma = np.zeros((12, whitened.shape[1]))
-            for b in range(whitened.shape[0]):
-                chroma[(b // (bins_per_octave // 12)) % 12, :] += whitened[b, :]
-            return chroma
+            # (octave, pitch class, bin within semitone, frame) -> (pitch class, frame)
+            return whitened.reshape(-1, 12, bins_per_octave // 12, whitened.shape[1]).sum(axis=(0, 2))
 
         ct, cb = collapse(cqt_treble), collapse(cqt_bass)
-        final = np.zeros((24, ct.shape[1]))
-        for i in range(12):
-            lib_idx = (i + 9) % 12
-            tp, bp = np.max(ct, axis=0) + 1e-10, np.max(cb, axis=0) + 1e-10
-            final[i, :], final[i + 12, :] = cb[lib_idx, :] / bp, ct[lib_idx, :] / tp
-        return final.T
-
-    def transcribe(self, audio, self_trans_prob=0.85):
+        lib_idx = (np.arange(12) + 9) % 12
+        tp, bp = np.max(ct, axis=0) + 1e-10, np.max(cb, axis=0) + 1e-10
+        return np.vstack((cb[lib_idx] / bp, ct[lib_idx] / tp)).T
+
+    def _observation_likelihoods(self, chroma_subs):
+        """
+        Scores every (frame, chord) pair against the (n_chords x 24) template bank
+        in one matrix product, then maps similarities to 1.6^x normalized per frame.
+        """
+        sims = chroma_subs @ self.chord_templates.T
+        sims[:, self.n_idx] *= self.n_weight
+        sims = np.clip(sims, 0.0, 200.0)
+        if sims.dtype == np.float32:
+            # 1.6^200 overflows float32; a per-frame shift cancels in the normalization
+            sims -= np.max(sims, axis=1, keepdims=True)
+        sims = np.power(sims.dtype.type(1.6), sims)
+        return sims / (np.sum(sims, axis=1, keepdims=True) + 1e-10)
+
+    def _viterbi_init(self, log_obs_0):
+        delta = np.full(len(self.chord_names), -np.inf, dtype=log_obs_0.dtype)
+        delta[self.n_idx] = 0.0
+        return delta + log_obs_0
+
+    def _viterbi_step(self, delta, t, log_obs_t, self_trans_prob=0.85):
+        """
+        Advances the log-space Viterbi scores by one 16th-note step for all chord states.
+        Every state may stay (stay_p) or switch uniformly to any other state, so the
+        best predecessor of state j is either j itself or the best other state.
+        Returns the new scores and the back-pointers of step t.
+        """
+        n_chords = len(delta)
+        states = np.arange(n_chords)
+        stay_p = self_trans_prob
+        if (t % 16) == 0 or (t % 16) == 8: stay_p *= 0.8
+        elif (t % 4) == 0: stay_p *= 0.9
+        # float64 scalars would promote float32 scores to float64 under numpy 2
+        log_stay, log_sw = delta.dtype.type(np.log(stay_p)), delta.dtype.type(np.log((1.0 - stay_p) / (n_chords - 1)))
+
+        # Best switch source: the overall argmax, or the runner-up for the argmax itself
+        best = np.argmax(delta)
+        masked = delta.copy()
+        masked[best] = -np.inf
+        src = np.full(n_chords, best)
+        src[best] = np.argmax(masked)
+
+        stay_sc, sw_sc = delta + log_stay, delta[src] + log_sw
+        # Ties resolve to the lower index, like np.argmax over the full score row
+        stay = (stay_sc > sw_sc) | ((stay_sc == sw_sc) & (states < src))
+        delta = np.where(stay, stay_sc, sw_sc) + log_obs_t
+        return delta - np.max(delta), np.where(stay, states, src)
+
+    def _viterbi(self, obs_matrix, self_trans_prob=0.85):
+        n_subs = obs_matrix.shape[0]
+        with np.errstate(divide='ignore'):
+            log_obs = np.log(obs_matrix)
+
+        delta = self._viterbi_init(log_obs[0])
+        psi = np.zeros(obs_matrix.shape, dtype=int)
+        for t in range(1, n_subs):
+            delta, psi[t] = self._viterbi_step(delta, t, log_obs[t], self_trans_prob)
+
+        path = np.zeros(n_subs, dtype=int)
+        path[-1] = np.argmax(delta)
+        for t in range(n_subs - 2, -1, -1): path[t] = psi[t+1, path[t+1]]
+        return path
+
+    def _viterbi_online(self, obs_rows, self_trans_prob=0.85, lag=64):
+        """
+        Fixed-lag Viterbi over an iterable of observation rows. Once step t is decoded,
+        the state of step t - lag is decided by backtracking from the current best state;
+        the last lag steps are flushed with a full backtrack at the end. Yields states
+        in step order and keeps only lag back-pointer rows in memory.
+        """
+        psi, delta, n_decided = collections.deque(maxlen=lag), None, 0
+        for t, obs_row in enumerate(obs_rows):
+            with np.errstate(divide='ignore'):
+                log_obs = np.log(obs_row)
+            if delta is None:
+                delta = self._viterbi_init(log_obs)
+            else:
+                delta, psi_t = self._viterbi_step(delta, t, log_obs, self_trans_prob)
+                psi.append(psi_t)
+            if t >= lag:
+                state = np.argmax(delta)
+                for psi_t in reversed(psi): state = psi_t[state]
+                n_decided += 1
+                yield state
+
+        if delta is None:
+            return
+        tail = [np.argmax(delta)]
+        for psi_t in reversed(psi): tail.append(psi_t[tail[-1]])
+        # tail covers steps t - len(psi) .. t; the earliest may already be decided
+        tail = tail[::-1][n_decided - (t - len(psi)):]
+        yield from tail
+
+    def track_beats(self, audio, tempo=None):
+        return track_beats(audio, sr=self.sr, hop_size=self.hop_size, tempo=tempo)
+
+    def transcribe(self, audio, self_trans_prob=0.85, beat_frames=None, tempo=None, return_beats=False):
+        """
+        Transcribes chords at 16th-note resolution. Precomputed beat_frames (and tempo)
+        skip beat tracking; with return_beats, returns (estimates, tempo, beat_frames).
+        """
         chroma_frames = self.extract_chroma(audio)
-        tempo, beat_frames = librosa.beat.beat_track(y=audio, sr=self.sr, hop_length=self.hop_size)
+        report_progress(0.5, "Chroma extracted")
+        if beat_frames is None:
+            tempo, beat_frames = self.track_beats(audio, tempo=tempo)
+            report_progress(0.7, "Beats tracked")
         
         sub_beat_frames = []
         for i in range(len(beat_frames) - 1):
             sub_beat_frames.extend(np.linspace(beat_frames[i], beat_frames[i+1], 5)[:-1].astype(int))
         
         chroma_subs = librosa.util.sync(chroma_frames.T, sub_beat_frames, aggregate=np.median).T
-        n_subs, n_chords = chroma_subs.shape[0], len(self.chord_names)
-        
-        obs_matrix = np.zeros((n_subs, n_chords))
-        for i in range(n_subs):
-            sims = np.zeros(n_chords)
-            for j in range(n_chords):
-                sim = np.dot(chroma_subs[i], self.chord_templates[j])
-                if self.chord_names[j] == 'N': sim *= 0.6
-                sims[j] = np.power(1.6, max(0.0, min(200.0, sim)))
-            obs_matrix[i] = sims / (np.sum(sims) + 1e-10)
         
-        delta, psi = np.zeros((n_subs, n_chords)), np.zeros((n_subs, n_chords), dtype=int)
-        delta[0, self.chord_names.index('N')] = 1.0
-        delta[0] = delta[0] * obs_matrix[0]
-        delta[0] /= (np.sum(delta[0]) + 1e-10)
-        
-        for t in range(1, n_subs):
-            stay_p = self_trans_prob
-            if (t % 16) == 0 or (t % 16) == 8: stay_p *= 0.8
-            elif (t % 4) == 0: stay_p *= 0.9
-            
-            sw_p = (1.0 - stay_p) / (n_chords - 1)
-            for j in range(n_chords):
-                sc = delta[t-1] * sw_p
-                sc[j] = delta[t-1, j] * stay_p
-                psi[t, j] = np.argmax(sc)
-                delta[t, j] = sc[psi[t, j]] * obs_matrix[t, j]
-            delta[t] /= (np.sum(delta[t]) + 1e-10)
-            
-        path = np.zeros(n_subs, dtype=int)
-        path[-1] = np.argmax(delta[-1])
-        for t in range(n_subs - 2, -1, -1): path[t] = psi[t+1, path[t+1]]
-            
+        with span("obs_matrix"):
+            obs_matrix = self._observation_likelihoods(chroma_subs)
+        with span("viterbi"):
+            path = self._viterbi(obs_matrix, self_trans_prob)
+        report_progress(1.0, "Chords decoded")
+
         sub_times = librosa.frames_to_time(sub_beat_frames, sr=self.sr, hop_length=self.hop_size)
         estimates, start_time, curr_idx = [], 0.0, path[0]
         for i in range(1, len(path)):
@@ -205,29 +310,133 @@ class ChordTranscriber:
                 estimates.append({'label': self.chord_names[curr_idx], 'start': float(start_time), 'end': float(sub_times[i])})
                 start_time, curr_idx = sub_times[i], path[i]
         estimates.append({'label': self.chord_names[curr_idx], 'start': float(start_time), 'end': float(librosa.get_duration(y=audio, sr=self.sr))})
+        if return_beats:
+            return estimates, tempo, beat_frames
         return estimates
-def nnls_chord_transcribe(audio_path, return_beats=False):
+
+    def _stream_windows(self, blocks, block_len, context_frames):
+        """
+        Cuts a stream of sample blocks into analysis windows of block_len samples plus
+        context_frames of overlap on each side (the stream starts with that much silence).
+        Yields (samples, first core frame, core slice of the window's frames, is_last).
+        """
+        hop = self.hop_size
+        ctx_len = context_frames * hop
+        buf, first = np.zeros(ctx_len, dtype=np.float32), 0
+        for block in blocks:
+            buf = np.concatenate((buf, np.asarray(block, dtype=np.float32)))
+            while len(buf) >= block_len + 2 * ctx_len:
+                yield buf[:block_len + 2 * ctx_len], first, slice(context_frames, context_frames + block_len // hop), False
+                buf, first = buf[block_len:], first + block_len // hop
+        yield buf, first, slice(context_frames, None), True
+
+    def transcribe_stream(self, blocks, self_trans_prob=0.85, lag=64, block_seconds=30.0, context_frames=48):
+        """
+        Streaming variant of transcribe() for long recordings. Consumes an iterable of
+        mono sample blocks (any size, at self.sr) and yields {'start', 'end', 'chord'}
+        segments as they are decided, with memory bounded by block_seconds and lag.
+
+        Audio is analysed in windows of block_seconds plus context_frames of overlap on
+        each side, which covers the longest CQT filter; only the core frames are kept,
+        so chroma agrees with the whole-file transform across window seams (to about
+        1e-3). The first half second differs more, since the whole-file transform starts
+        at librosa's edge padding rather than after leading silence. Whitening runs
+        across the CQT bins of each frame and needs no carry-over. Beats are tracked per
+        window and joined at the seams; windows without beats (silence, failed tracking)
+        are cut into steps of the last known sub-beat length, so the chroma buffer never
+        outgrows a window. The chord path comes from a fixed-lag Viterbi (see _viterbi_online).
+        """
+        hop = self.hop_size
+        block_len = max(1, int(block_seconds * self.sr / hop)) * hop
+        n_samples, starts = 0, collections.deque()
+
+        def counted(blocks):
+            nonlocal n_samples
+            for block in blocks:
+                n_samples += len(block)
+                yield block
+
+        def sub_beat_chroma():
+            # Yields (start frame, median chroma) per 16th-note step, as in librosa.util.sync
+            chroma_buf, chroma_first = np.zeros((0, 24), dtype=self.dtype), 0
+            bounds, last_beat = collections.deque([0]), None
+            period = 60.0 * self.sr / (hop * 120.0)  # frames per beat until a tempo is found
+            for chunk, first, core, last in self._stream_windows(counted(blocks), block_len, context_frames):
+                chroma_buf = np.vstack((chroma_buf, self.extract_chroma(chunk)[core]))
+                onset_env = librosa.onset.onset_strength(y=chunk, sr=self.sr, hop_length=hop, aggregate=np.median)[core]
+                beats = []
+                if onset_env.any():
+                    tempo, beats = librosa.beat.beat_track(onset_envelope=onset_env, sr=self.sr, hop_length=hop, trim=False)
+                    tempo = float(np.atleast_1d(tempo)[0])
+                    if tempo > 0:
+                        period = 60.0 * self.sr / (hop * tempo)
+                    for beat in beats + first:
+                        if last_beat is not None:
+                            if beat - last_beat < 0.5 * period: continue  # same beat found on both sides of a seam
+                            for sub in np.linspace(last_beat, beat, 5)[:-1].astype(int):
+                                if sub > bounds[-1]: bounds.append(sub)
+                        last_beat = beat
+                if not len(beats):
+                    # No beat to align to: step through the window so it can be released
+                    end, step = chroma_first + len(chroma_buf), max(1, int(period / 4))
+                    bounds.extend(range(bounds[-1] + step, end, step))
+                    last_beat = None
+
+                while len(bounds) > 1 and bounds[1] <= chroma_first + len(chroma_buf):
+                    yield bounds[0], np.median(chroma_buf[bounds[0] - chroma_first:bounds[1] - chroma_first], axis=0)
+                    bounds.popleft()
+                chroma_buf, chroma_first = chroma_buf[bounds[0] - chroma_first:], bounds[0]
+            yield bounds[0], np.median(chroma_buf, axis=0)
+
+        def obs_rows():
+            for start, chroma_row in sub_beat_chroma():
+                starts.append(start)
+                yield self._observation_likelihoods(chroma_row[np.newaxis])[0]
+
+        label, seg_start = None, 0.0
+        for state in self._viterbi_online(obs_rows(), self_trans_prob, lag):
+            start = float(librosa.frames_to_time(starts.popleft(), sr=self.sr, hop_length=hop))
+            if state != label:
+                if label is not None:
+                    yield {'start': seg_start, 'end': start, 'chord': self.chord_names[label]}
+                label, seg_start = state, start
+        if label is not None:
+            yield {'start': seg_start, 'end': float(n_samples / self.sr), 'chord': self.chord_names[label]}
+
+def nnls_chord_transcribe(audio_path, return_beats=False, chord_dict_raw=CHORD_DICT_RAW, dtype=np.float64):
     """
     High-level function to transcribe chords from an audio file.
+    Reuses the process-wide transcriber (and template bank) for chord_dict_raw.
     """
-    audio, sr = librosa.load(audio_path, sr=44100)
-    transcriber = ChordTranscriber(sample_rate=sr)
+    audio, sr = load_audio(audio_path, sr=44100)
+    transcriber = get_chord_transcriber(sr, 2048, chord_dict_raw, dtype)
     
-    # Get beats
-    tempo, beat_frames = librosa.beat.beat_track(y=audio, sr=sr, hop_length=transcriber.hop_size)
+    # Track beats once and share them with the chord decoder
+    tempo, beat_frames = transcriber.track_beats(audio)
     beat_times = librosa.frames_to_time(beat_frames, sr=sr, hop_length=transcriber.hop_size)
     
-    estimates = transcriber.transcribe(audio)
+    estimates = transcriber.transcribe(audio, beat_frames=beat_frames, tempo=tempo)
     chords = [{'start': e['start'], 'end': e['end'], 'chord': e['label']} for e in estimates]
     
     if return_beats:
         return {
             'chords': chords,
             'beats': beat_times.tolist(),
-            'tempo': float(tempo)
+            'tempo': float(np.atleast_1d(tempo)[0])
         }
     return chords
 
+def nnls_chord_transcribe_stream(audio_path, block_seconds=30.0, lag=64, chord_dict_raw=CHORD_DICT_RAW, dtype=np.float64):
+    """
+    Streaming chord recognition for long recordings (live sets, DJ mixes).
+    Reads the file block by block at its native sample rate and yields
+    {'start', 'end', 'chord'} segments; memory does not grow with track length.
+    """
+    with sf.SoundFile(audio_path) as f:
+        transcriber = get_chord_transcriber(f.samplerate, 2048, chord_dict_raw, dtype)
+        blocks = (block.mean(axis=1) for block in f.blocks(blocksize=65536, dtype='float32', always_2d=True))
+        yield from transcriber.transcribe_stream(blocks, lag=lag, block_seconds=block_seconds)
+
 
 def main():
     if len(sys.argv) < 2:
@@ -239,7 +448,7 @@ def main():
     audio, sr = librosa.load(audio_path, sr=44100)
     
     print("Transcribing (16th-note resolution)...")
-    transcriber = ChordTranscriber(sample_rate=sr)
+    transcriber = get_chord_transcriber(sr)
     chords = transcriber.transcribe(audio)
     
     if len(sys.argv) > 2:
@@ -1,30 +1,34 @@
 import os
+from core.audio_cache import load_audio
+from core.beat_tracker import analyze_beats
 from core.demucs_source_separator import demucs_source_separate
 from core.whisper_lyrics_transcriber import whisper_lyrics_transcribe
 from core.nnls_chord_transcriber import nnls_chord_transcribe, is_available as nnls_available
 from core.vamp_chord_transcriber import vamp_chord_transcribe, is_available as vamp_available
 
-def separate_sources(input_audio_path, media_root):
+def separate_sources(input_audio_path, media_root, **demucs_options):
     """
     Separates audio into vocals and accompaniment using Demucs.
+    demucs_options (preset, threads, jobs, segment, overlap, shifts) are passed through.
     Returns a dictionary with paths to 'vocals' and 'no_vocals'.
     """
-    stems = demucs_source_separate(input_audio_path, media_root)
+    stems = demucs_source_separate(input_audio_path, media_root, **demucs_options)
     if not stems or not stems.get('vocals') or not stems.get('no_vocals'):
         raise Exception("Source separation failed or returned incomplete results.")
     return stems
 
-def transcribe_lyrics(vocals_path, media_root, language="zh"):
+def transcribe_lyrics(vocals_path, media_root, language="zh", model_name="base"):
     """
     Transcribes lyrics from the vocals track using Whisper.
     Supports languages: 'en', 'zh', 'ja', etc.
     """
-    return whisper_lyrics_transcribe(vocals_path, media_root, model_name="base", language=language)
+    return whisper_lyrics_transcribe(vocals_path, media_root, model_name=model_name, language=language)
 
 def recognize_chords(accompaniment_path, algorithm='nnls'):
     """
     Recognizes chords from the accompaniment track using the specified algorithm.
     Also extracts beats and tempo, falling back to NNLS if necessary.
+    The Vamp route decodes the track once and only runs beat analysis on top of Chordino.
     """
     chord_results = None
     
@@ -32,8 +36,9 @@ def recognize_chords(accompaniment_path, algorithm='nnls'):
     vamp_ok = vamp_available()
 
     if algorithm == 'vamp' and vamp_ok:
-        chords = vamp_chord_transcribe(accompaniment_path)
-        beat_info = nnls_chord_transcribe(accompaniment_path, return_beats=True)
+        audio, sr = load_audio(accompaniment_path, sr=44100)
+        chords = vamp_chord_transcribe(accompaniment_path, audio=audio, sr=sr)
+        beat_info = analyze_beats(audio, sr)
         chord_results = {
             'chords': chords,
             'beats': beat_info['beats'],
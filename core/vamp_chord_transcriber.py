@@ -1,6 +1,7 @@
 import os
 import librosa
 import numpy as np
+from core.audio_cache import load_audio
 
 def is_available():
     try:
@@ -9,15 +10,19 @@ def is_available():
     except ImportError:
         return False
 
-def vamp_chord_transcribe(audio_path):
+def vamp_chord_transcribe(audio_path, audio=None, sr=44100):
     """
     Uses Vamp plugin system with Chordino (qm-vamp-plugins:qm-chordtranscriber).
+    Pass already decoded audio (at sr) to skip loading audio_path.
     """
     import vamp
     
     try:
         # Load audio
-        y, sr = librosa.load(audio_path, sr=44100)
+        if audio is None:
+            y, sr = load_audio(audio_path, sr=44100)
+        else:
+            y = audio
         
         # Chordino plugin identifier
         # Note: 'qm-vamp-plugins:qm-chordtranscriber' is the standard identifier
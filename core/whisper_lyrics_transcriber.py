@@ -2,7 +2,19 @@ import shutil
 import subprocess
 import json
 import os
+import time
+import atexit
 from pathlib import Path
+from core.instrumentation import span
+
+# Optional warm backend: a whisper.cpp server (whisper-server) on localhost keeps the
+# model resident across requests. Enabled by setting WHISPER_SERVER_PORT; it serves
+# WHISPER_SERVER_MODEL only, other models (or a server that fails) use whisper-cli.
+WHISPER_SERVER_HOST = "127.0.0.1"
+WHISPER_SERVER_PORT = os.environ.get("WHISPER_SERVER_PORT")
+WHISPER_SERVER_MODEL = os.environ.get("WHISPER_SERVER_MODEL", "base")
+
+_server_process = None
 
 def is_available():
     # 1. Check for binary
@@ -43,10 +55,69 @@ def is_available():
     except Exception as e:
         return False, f"Error resolving whisper-cli path: {e}"
 
+def _server_url(port):
+    return f"http://{WHISPER_SERVER_HOST}:{port}"
+
+def _server_alive(port):
+    import requests
+    try:
+        requests.get(_server_url(port), timeout=1)
+        return True
+    except requests.RequestException:
+        return False
+
+def ensure_whisper_server(model_path, port, startup_timeout=60.0):
+    """
+    Makes sure a whisper-server for model_path answers on localhost:port, starting it
+    (once per worker process) if needed and restarting it if it has died.
+    Another worker's server already bound to the port is reused.
+    """
+    global _server_process
+    if _server_alive(port):
+        return True
+    if _server_process is None or _server_process.poll() is not None:
+        binary = shutil.which("whisper-server")
+        if binary is None:
+            return False
+        _server_process = subprocess.Popen(
+            [binary, "-m", model_path, "--host", WHISPER_SERVER_HOST, "--port", str(port), "--vad", "-vt", "0.1"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        atexit.register(_server_process.terminate)
+
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if _server_alive(port):
+            return True
+        if _server_process.poll() is not None:
+            return False
+        time.sleep(0.25)
+    return False
+
+def _format_timestamp(seconds):
+    ms = int(round(seconds * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+def _server_transcribe(audio_path, port, language):
+    """
+    Posts the audio to the server's /inference endpoint and converts its segments into
+    the whisper-cli -oj 'transcription' entries (timestamps, offsets in ms, text).
+    """
+    import requests
+    with open(audio_path, 'rb') as f:
+        response = requests.post(f"{_server_url(port)}/inference", files={"file": f},
+                                 data={"language": language, "response_format": "verbose_json"}, timeout=1800)
+    response.raise_for_status()
+    return [{
+        "timestamps": {"from": _format_timestamp(seg["start"]), "to": _format_timestamp(seg["end"])},
+        "offsets": {"from": int(round(seg["start"] * 1000)), "to": int(round(seg["end"] * 1000))},
+        "text": seg["text"],
+    } for seg in response.json().get("segments", [])]
+
 def whisper_lyrics_transcribe(audio_path, media_root, model_name="base", language="zh"):
     """
     Uses Whisper-CLI for timed transcripts.
     CMD: whisper-cli -m "model" -f "vocals.wav" -l zh --vad -vt 0.1 -oj
+    Goes through the warm whisper-server instead when WHISPER_SERVER_PORT is set.
     """
     status, model_info = is_available()
     if not status:
@@ -62,6 +133,16 @@ def whisper_lyrics_transcribe(audio_path, media_root, model_name="base", languag
             print(f"Whisper Model Error: {model_path} not found")
             return None
 
+    if WHISPER_SERVER_PORT and model_name == WHISPER_SERVER_MODEL:
+        try:
+            port = int(WHISPER_SERVER_PORT)
+            if ensure_whisper_server(model_path, port):
+                with span("whisper_server"):
+                    return _server_transcribe(audio_path, port, language)
+            print("Whisper Server Error: server did not start, using whisper-cli")
+        except Exception as e:
+            print(f"Whisper Server Error: {e}, using whisper-cli")
+
     cmd = [
         "whisper-cli",
         "-m", model_path,
@@ -73,7 +154,8 @@ def whisper_lyrics_transcribe(audio_path, media_root, model_name="base", languag
     ]
     
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        with span("whisper_cli"):
+            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
         data = json.loads(result.stdout)
         # whisper-cli -oj usually returns result in 'transcription' or directly
         # depending on version. Let's assume it has 'transcription' or 'segments'
@@ -0,0 +1,193 @@
+"""
+Benchmarks for the core transcription hot paths on deterministic synthetic audio.
+
+    python tests/benchmark.py --seconds 120            # report time / peak memory per stage
+    python tests/benchmark.py --seconds 120 --save     # store the report as the baseline
+    python tests/benchmark.py --seconds 120 --compare  # flag regressions against the baseline
+
+Times are the best of --repeats runs; peak memory is measured in a separate traced run
+(tracemalloc sees numpy buffers). Exits with status 1 when a stage regresses.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import librosa
+import soundfile as sf
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from core.basic_pitch_transcriber import midi_to_freq, render_notes
+from core.nnls_chord_transcriber import ChordTranscriber
+from core.audio_cache import load_audio
+from core.services import recognize_chords
+
+BASELINE_PATH = Path(__file__).with_name("benchmark_baseline.json")
+
+# I-V-vi-IV in C, bass note first (MIDI pitches)
+PROGRESSION = [(48, 60, 64, 67), (43, 59, 62, 67), (45, 60, 64, 69), (41, 60, 65, 69)]
+
+def progression_notes(seconds, seconds_per_chord=2.0):
+    """Note events (start, end, pitch, amp) for the progression repeated over `seconds`."""
+    notes = []
+    for i in range(int(seconds / seconds_per_chord)):
+        start = i * seconds_per_chord
+        for j, pitch in enumerate(PROGRESSION[i % len(PROGRESSION)]):
+            notes.append((start, start + seconds_per_chord, pitch, 1.0 if j == 0 else 0.5))
+    return notes
+
+def synthesize_progression(chords, sr=44100, seconds_per_chord=2.0, beat_clicks=False, gain=1.0):
+    """
+    Deterministic additive-sine rendering of a chord progression, bass note first.
+    Notes are MIDI pitches or note names ("C4"); beat_clicks adds a click every half second.
+    """
+    t = np.arange(int(sr * seconds_per_chord)) / sr
+    fade = np.minimum(1.0, np.minimum(t, seconds_per_chord - t) / 0.01)
+    clicks = np.zeros_like(t)
+    if beat_clicks:
+        for beat in np.arange(0, seconds_per_chord, 0.5):
+            clicks[int(beat * sr):int(beat * sr) + 200] = 0.8
+    segments = []
+    for chord in chords:
+        freqs = [librosa.note_to_hz(n) if isinstance(n, str) else midi_to_freq(n) for n in chord]
+        wave = sum(np.sin(2 * np.pi * f * t) * (0.6 if j == 0 else 0.3) for j, f in enumerate(freqs))
+        segments.append(wave * fade + clicks)
+    return (np.concatenate(segments) * gain).astype(np.float32)
+
+def synthesize_audio(seconds, sr=44100, seconds_per_chord=2.0):
+    """The benchmark progression repeated over `seconds`, with beat clicks."""
+    chords = [PROGRESSION[i % len(PROGRESSION)] for i in range(int(seconds / seconds_per_chord))]
+    return synthesize_progression(chords, sr, seconds_per_chord, beat_clicks=True, gain=0.25)
+
+def measure(fn, repeats=3, setup=None):
+    """Best-of-repeats wall time and traced peak memory of fn()."""
+    times = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"time_s": round(min(times), 6), "peak_mb": round(peak / 1024 ** 2, 3)}
+
+def run_benchmarks(seconds=60.0, repeats=3, sr=44100):
+    audio = synthesize_audio(seconds, sr)
+    notes = progression_notes(seconds)
+    transcriber = ChordTranscriber(sample_rate=sr)
+
+    chroma = transcriber.extract_chroma(audio)
+    tempo, beat_frames = transcriber.track_beats(audio)
+    sub_beat_frames = []
+    for i in range(len(beat_frames) - 1):
+        sub_beat_frames.extend(np.linspace(beat_frames[i], beat_frames[i + 1], 5)[:-1].astype(int))
+    chroma_subs = librosa.util.sync(chroma.T, sub_beat_frames, aggregate=np.median).T
+    obs = transcriber._observation_likelihoods(chroma_subs)
+
+    stages = {
+        "extract_chroma": measure(lambda: transcriber.extract_chroma(audio), repeats),
+        "track_beats": measure(lambda: transcriber.track_beats(audio), repeats),
+        "observation_likelihoods": measure(lambda: transcriber._observation_likelihoods(chroma_subs), repeats),
+        "viterbi": measure(lambda: transcriber._viterbi(obs), repeats),
+        "transcribe": measure(lambda: transcriber.transcribe(audio, beat_frames=beat_frames, tempo=tempo), repeats),
+        "render_notes": measure(lambda: render_notes(notes, sr), repeats),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_path = os.path.join(tmp, "progression.wav")
+        sf.write(audio_path, audio, sr)
+        cache_dir = os.path.join(tmp, "decoded")
+
+        def clear_cache():
+            for f in Path(cache_dir).glob("*"):
+                f.unlink()
+
+        stages["load_audio_cold"] = measure(lambda: load_audio(audio_path, sr=sr, cache_dir=cache_dir), repeats, setup=clear_cache)
+        stages["load_audio_warm"] = measure(lambda: load_audio(audio_path, sr=sr, cache_dir=cache_dir), repeats)
+        # End to end from the file, as the chord stage of the pipeline runs it
+        stages["recognize_chords"] = measure(lambda: recognize_chords(audio_path, algorithm='nnls'), repeats)
+
+    # What the pipeline adds on top of the analysis itself (decode, beat tracking, result building)
+    stages["pipeline_overhead"] = {
+        "time_s": round(max(stages["recognize_chords"]["time_s"] - stages["track_beats"]["time_s"]
+                            - stages["transcribe"]["time_s"], 0.0), 6),
+        "peak_mb": round(max(stages["recognize_chords"]["peak_mb"] - stages["transcribe"]["peak_mb"], 0.0), 3),
+    }
+
+    return {
+        "config": {"seconds": seconds, "sample_rate": sr, "repeats": repeats},
+        "environment": {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine()},
+        "stages": stages,
+    }
+
+# Absolute changes below these are timer/allocator noise, whatever the ratio
+MIN_DELTA = {"time_s": 0.005, "peak_mb": 0.5}
+
+def compare(report, baseline, time_tolerance=0.25, memory_tolerance=0.25):
+    """
+    Returns [(stage, metric, baseline, current)] for every stage that got slower or
+    hungrier than the baseline by more than the tolerance (a fraction).
+    """
+    regressions = []
+    for name, current in report["stages"].items():
+        previous = baseline["stages"].get(name)
+        if previous is None:
+            continue
+        for metric, tolerance in (("time_s", time_tolerance), ("peak_mb", memory_tolerance)):
+            delta = current[metric] - previous[metric]
+            if delta > MIN_DELTA[metric] and current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append((name, metric, previous[metric], current[metric]))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the core transcription stages.")
+    parser.add_argument("--seconds", type=float, default=60.0, help="length of the synthetic progression")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="write this run as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="flag regressions against the baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.25)
+    parser.add_argument("--memory-tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.seconds, args.repeats)
+    print(f"{'stage':<26}{'time (s)':>12}{'peak (MB)':>12}")
+    for name, stage in report["stages"].items():
+        print(f"{name:<26}{stage['time_s']:>12.4f}{stage['peak_mb']:>12.2f}")
+
+    status = 0
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["config"] != report["config"]:
+            print(f"Baseline was recorded with {baseline['config']}, not comparing.")
+        else:
+            regressions = compare(report, baseline, args.time_tolerance, args.memory_tolerance)
+            for name, metric, previous, current in regressions:
+                print(f"REGRESSION {name} {metric}: {previous} -> {current}")
+            if not regressions:
+                print("No regressions against baseline.")
+            status = 1 if regressions else 0
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    sys.exit(status)
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,26 @@ import unittest
 from unittest.mock import patch, MagicMock
 import numpy as np
 import os
+import sys
 import json
+import tempfile
+import subprocess
 from pathlib import Path
 
 # Import the algorithms
-from core.basic_pitch_transcriber import midi_to_freq, generate_sine_wave, basic_pitch_transcribe
+from core.basic_pitch_transcriber import midi_to_freq, generate_sine_wave, render_notes, basic_pitch_transcribe, basic_pitch_note_events
+from core.basic_pitch_transcriber import NOTE_DTYPE, basic_pitch_notes, load_notes, notes_to_array, synthesize_notes, write_midi
 from core.demucs_source_separator import demucs_source_separate
-from core.nnls_chord_transcriber import ChordTranscriber, nnls_chord_transcribe
+from core.nnls_chord_transcriber import ChordTranscriber, nnls_chord_transcribe, load_chord_dict, get_chord_transcriber
 from core.whisper_lyrics_transcriber import whisper_lyrics_transcribe
+from core.audio_cache import load_audio, content_hash, register_content_hash, probe_audio
+from core.instrumentation import recording, span, report_progress
 from core.pipeline import run_pipeline
+from benchmark import synthesize_progression
+
+CHORD_DICT_CUSTOM = """
+=0,0,0,0,0,0,0,0,0,0,0,0,1,0,0,0,1,0,0,1,0,0,0,0
+"""
 
 class TestAlgorithms(unittest.TestCase):
 
@@ -26,26 +37,101 @@ class TestAlgorithms(unittest.TestCase):
         self.assertEqual(len(wave), int(duration * sr))
         self.assertTrue(np.max(np.abs(wave)) <= 0.3)
 
+    def test_render_notes_matches_per_note_synthesis(self):
+        sr = 44100
+        notes = [[0.0, 1.0, 60, 0.5, []], [0.25, 0.75, 64, 1.0, []], [0.5, 1.5, 60, 0.8, []], [1.0, 1.0, 67, 1.0, []]]
+        buffer = render_notes(notes, sr)
+        self.assertEqual(len(buffer), int(2.0 * sr))
+        expected = np.zeros(len(buffer))
+        for start_s, end_s, pitch, amp, _ in notes:
+            if end_s > start_s:
+                wave = generate_sine_wave(midi_to_freq(pitch), end_s - start_s, sr, amplitude=amp * 0.2)
+                expected[int(start_s * sr):int(start_s * sr) + len(wave)] += wave
+        np.testing.assert_allclose(buffer, expected, atol=1e-5)
+
+    def test_render_notes_clips_tails(self):
+        sr = 44100
+        buffer = render_notes([[0.5, 2.0, 69, 1.0, []]], sr, total_samples=sr)
+        self.assertEqual(len(buffer), sr)
+        # The note is cut at the buffer end instead of being dropped
+        self.assertGreater(np.max(np.abs(buffer[int(0.9 * sr):])), 0.1)
+
+    @patch('core.basic_pitch_transcriber.load_basic_pitch_model')
     @patch('basic_pitch.inference.predict')
-    @patch('scipy.io.wavfile.write')
-    def test_basic_pitch_transcribe(self, mock_wav_write, mock_predict):
+    def test_basic_pitch_note_events_batch(self, mock_predict, mock_model):
+        mock_predict.side_effect = lambda path, model: (None, None, [[0.0, 1.0, 60 if path == "a.wav" else 62, 0.5, []]])
+        result = basic_pitch_note_events(["a.wav", "b.wav"])
+        self.assertEqual(result["a.wav"][0][2], 60)
+        self.assertEqual(result["b.wav"][0][2], 62)
+        # One warm model serves every file
+        mock_model.assert_called_once()
+        self.assertTrue(all(c.args[1] is mock_model.return_value for c in mock_predict.call_args_list))
+
+    @patch('core.basic_pitch_transcriber.load_basic_pitch_model')
+    @patch('basic_pitch.inference.predict')
+    def test_basic_pitch_transcribe(self, mock_predict, mock_model):
         # Mocking predict to return dummy info
         # _, _, note_events = predict(input_path)
         mock_predict.return_value = (None, None, [[0.0, 1.0, 60, 0.5, 0]])
         
         input_path = "dummy.wav"
-        output_path = "output.wav"
-        
-        result = basic_pitch_transcribe(input_path, output_path)
-        self.assertTrue(result.endswith("output.wav"))
-        mock_wav_write.assert_called()
+        with tempfile.TemporaryDirectory() as tmp:
+            output_path = os.path.join(tmp, "output.wav")
+            result = basic_pitch_transcribe(input_path, output_path)
+            self.assertTrue(result.endswith("output.wav"))
+            # Written under a temporary name and moved into place whole
+            self.assertEqual(os.listdir(tmp), ["output.wav"])
+
+    @patch('core.basic_pitch_transcriber.basic_pitch_note_events')
+    def test_basic_pitch_notes_export_without_synthesis(self, mock_events):
+        events = [[0.0, 1.0, 60, 0.5, [1, 2]], [0.25, 0.75, 64, 1.0, []]]
+        mock_events.return_value = {"in.wav": events}
+        from scipy.io import wavfile
+        with tempfile.TemporaryDirectory() as tmp, patch('scipy.io.wavfile.write', wraps=wavfile.write) as mock_wav_write:
+            paths = [os.path.join(tmp, "notes.npy"), os.path.join(tmp, "notes.json")]
+            notes = basic_pitch_notes("in.wav", paths)
+            mock_wav_write.assert_not_called()
+            self.assertEqual(notes.dtype, NOTE_DTYPE)
+            np.testing.assert_array_equal(notes, notes_to_array(events))
+            for path in paths:
+                np.testing.assert_array_equal(load_notes(path), notes)
+            with open(paths[1]) as f:
+                self.assertEqual(json.load(f)[1], {"start": 0.25, "end": 0.75, "pitch": 64, "amp": 1.0})
+
+            # Playback is rendered later from the stored array
+            wav_path = synthesize_notes(paths[0], os.path.join(tmp, "notes.wav"))
+            self.assertTrue(wav_path.endswith("notes.wav"))
+            _, rendered = wavfile.read(wav_path)
+            self.assertEqual(len(rendered), len(render_notes(events)))
+
+    def test_write_midi(self):
+        fake_pm = MagicMock()
+        with patch.dict(sys.modules, {'pretty_midi': fake_pm}):
+            write_midi([[0.0, 1.0, 60, 0.5, []], [1.0, 2.0, 67, 0.0, []]], "out.mid")
+        notes = [c.kwargs for c in fake_pm.Note.call_args_list]
+        self.assertEqual([(n['pitch'], n['velocity'], n['start'], n['end']) for n in notes], [(60, 64, 0.0, 1.0), (67, 1, 1.0, 2.0)])
+        fake_pm.PrettyMIDI.return_value.write.assert_called_once_with("out.mid")
+
+    def test_benchmark_flags_regressions(self):
+        from benchmark import compare, progression_notes, synthesize_audio
+        np.testing.assert_array_equal(synthesize_audio(4.0), synthesize_audio(4.0))
+        self.assertEqual(len(progression_notes(8.0)), 16)
+        baseline = {"stages": {"viterbi": {"time_s": 0.5, "peak_mb": 10.0}, "render_notes": {"time_s": 0.001, "peak_mb": 1.0}}}
+        report = {"stages": {"viterbi": {"time_s": 0.8, "peak_mb": 10.1}, "render_notes": {"time_s": 0.002, "peak_mb": 1.2},
+                             "new_stage": {"time_s": 1.0, "peak_mb": 1.0}}}
+        # render_notes doubled but stays within the noise floor; new stages have no baseline
+        self.assertEqual(compare(report, baseline), [("viterbi", "time_s", 0.5, 0.8)])
 
     # --- Demucs Source Separator Tests ---
+    @patch('core.demucs_source_separator.engine_available', return_value=False)
+    @patch('core.demucs_source_separator.os.utime')
+    @patch('core.demucs_source_separator.content_hash')
     @patch('subprocess.run')
     @patch('pathlib.Path.exists')
-    def test_demucs_source_separate(self, mock_exists, mock_run):
+    def test_demucs_source_separate(self, mock_exists, mock_run, mock_hash, mock_utime, mock_engine):
         mock_exists.return_value = True
         mock_run.return_value = MagicMock(returncode=0)
+        mock_hash.return_value = "0" * 64
         
         input_path = "song.mp3"
         media_root = "/tmp/media"
@@ -55,12 +141,142 @@ class TestAlgorithms(unittest.TestCase):
         self.assertIn("vocals", result)
         self.assertIn("no_vocals", result)
 
+    @patch('core.demucs_source_separator.engine_available', return_value=False)
+    @patch('subprocess.run')
+    def test_demucs_stem_cache(self, mock_run, mock_engine):
+        with tempfile.TemporaryDirectory() as tmp:
+            def fake_demucs(cmd, check, env=None):
+                stem_dir = Path(cmd[cmd.index("-o") + 1]) / "htdemucs" / cmd[cmd.index("--filename") + 1].split("/")[0]
+                stem_dir.mkdir(parents=True)
+                for stem in ("vocals", "no_vocals"):
+                    (stem_dir / f"{stem}.wav").write_bytes(b"\0" * 100)
+            mock_run.side_effect = fake_demucs
+
+            first, second = Path(tmp, "a.mp3"), Path(tmp, "b.mp3")
+            first.write_bytes(b"same song")
+            second.write_bytes(b"same song")
+            result = demucs_source_separate(first, tmp)
+            # Same content under another upload name is a cache hit
+            self.assertEqual(demucs_source_separate(second, tmp), result)
+            self.assertEqual(mock_run.call_count, 1)
+
+            # A different song over the budget evicts the least recently used stems
+            second.write_bytes(b"other song")
+            other = demucs_source_separate(second, tmp, max_cache_bytes=250)
+            self.assertEqual(mock_run.call_count, 2)
+            self.assertFalse(Path(result["vocals"]).exists())
+            self.assertTrue(Path(other["vocals"]).exists())
+
+    @patch('core.demucs_source_separator.engine_available', return_value=False)
+    @patch('subprocess.run')
+    def test_demucs_stem_cache_ignores_partial_stems(self, mock_run, mock_engine):
+        from core.demucs_source_separator import stem_cache_key, resolve_demucs_options
+        with tempfile.TemporaryDirectory() as tmp:
+            song = Path(tmp, "song.mp3")
+            song.write_bytes(b"song")
+            key = stem_cache_key(song, "htdemucs", {"two_stems": "vocals", **resolve_demucs_options()})
+            stem_dir = Path(tmp, "separated", "htdemucs", key)
+            # A worker was killed after writing one stem into the cache folder
+            stem_dir.mkdir(parents=True)
+            (stem_dir / "vocals.wav").write_bytes(b"\0" * 10)
+
+            def fake_demucs(cmd, check, env=None):
+                work_dir = Path(cmd[cmd.index("-o") + 1]) / "htdemucs" / cmd[cmd.index("--filename") + 1].split("/")[0]
+                work_dir.mkdir(parents=True)
+                (work_dir / "vocals.wav").write_bytes(b"\0" * 100)
+                # Nothing is visible under the cache key until both stems are written
+                self.assertEqual(list(stem_dir.glob("no_vocals.wav")), [])
+                if mock_run.call_count == 1:
+                    raise subprocess.CalledProcessError(-9, cmd)
+                (work_dir / "no_vocals.wav").write_bytes(b"\0" * 100)
+            mock_run.side_effect = fake_demucs
+
+            self.assertIsNone(demucs_source_separate(song, tmp))
+            result = demucs_source_separate(song, tmp)
+            self.assertEqual(mock_run.call_count, 2)
+            self.assertEqual(Path(result["vocals"]).stat().st_size, 100)
+            self.assertEqual(Path(result["no_vocals"]).parent, stem_dir)
+            # Failed and finished work folders are both gone
+            self.assertEqual(list(stem_dir.parent.glob("*.tmp")), [])
+
+    @patch('core.demucs_source_separator.engine_available', return_value=True)
+    @patch('core.demucs_source_separator._separate_in_process')
+    @patch('subprocess.run')
+    def test_demucs_in_process_engine(self, mock_run, mock_separate, mock_engine):
+        def fake_separate(input_path, stem_dir, model_name, options, threads=None, jobs=None):
+            stem_dir.mkdir(parents=True)
+            for stem in ("vocals", "no_vocals"):
+                (stem_dir / f"{stem}.wav").write_bytes(b"\0")
+        mock_separate.side_effect = fake_separate
+        with tempfile.TemporaryDirectory() as tmp:
+            song = Path(tmp, "song.mp3")
+            song.write_bytes(b"song")
+            result = demucs_source_separate(song, tmp)
+            mock_run.assert_not_called()
+            self.assertEqual(mock_separate.call_args.args[2], "htdemucs")
+            self.assertTrue(Path(result["vocals"]).exists())
+            self.assertTrue(Path(result["no_vocals"]).exists())
+
+    def test_demucs_in_process_restores_threads(self):
+        from core.demucs_source_separator import _separate_in_process
+        fake_torch = MagicMock()
+        fake_torch.get_num_threads.return_value = 8
+        fake_apply = MagicMock()
+        fake_apply.apply_model.side_effect = RuntimeError("out of memory")
+        modules = {'torch': fake_torch, 'demucs': MagicMock(), 'demucs.apply': fake_apply,
+                   'demucs.audio': MagicMock(), 'demucs.separate': MagicMock()}
+        options = {"shifts": 1, "overlap": 0.25, "segment": None}
+        with patch.dict(sys.modules, modules), patch('core.demucs_source_separator.load_demucs_model'):
+            with self.assertRaises(RuntimeError):
+                _separate_in_process("song.mp3", Path("stems"), "htdemucs", options, threads=2)
+        # The thread count is process-wide, so it is put back even when separation fails
+        self.assertEqual([c.args for c in fake_torch.set_num_threads.call_args_list], [(2,), (8,)])
+
+    @patch('core.demucs_source_separator.engine_available', return_value=False)
+    @patch('subprocess.run')
+    def test_demucs_presets_and_threads(self, mock_run, mock_engine):
+        with tempfile.TemporaryDirectory() as tmp:
+            song = Path(tmp, "song.mp3")
+            song.write_bytes(b"song")
+            demucs_source_separate(song, tmp)
+            demucs_source_separate(song, tmp, preset="fast", threads=2, jobs=3)
+            (default_cmd,), (cmd,) = (c.args for c in mock_run.call_args_list)
+            # Different quality settings are cached separately
+            self.assertNotEqual(default_cmd[default_cmd.index("--filename") + 1], cmd[cmd.index("--filename") + 1])
+
+            env = mock_run.call_args.kwargs['env']
+            self.assertEqual(cmd[cmd.index("--shifts") + 1], "0")
+            self.assertEqual(cmd[cmd.index("--overlap") + 1], "0.1")
+            self.assertEqual(cmd[cmd.index("-j") + 1], "3")
+            self.assertEqual(env["OMP_NUM_THREADS"], "2")
+            self.assertIsNone(demucs_source_separate(song, tmp, preset="unknown"))
+
     # --- NNLS Chord Transcriber Tests ---
     def test_chord_transcriber_init(self):
         ct = ChordTranscriber()
         self.assertTrue(len(ct.chord_names) > 0)
         self.assertTrue(len(ct.chord_templates) > 0)
 
+    def test_chord_dict_is_cached_and_read_only(self):
+        templates, names = load_chord_dict(CHORD_DICT_CUSTOM)
+        self.assertIs(load_chord_dict(CHORD_DICT_CUSTOM)[0], templates)
+        self.assertEqual(names, ('A', 'A#', 'B', 'C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'N'))
+        self.assertFalse(templates.flags.writeable)
+        self.assertIs(ChordTranscriber().chord_templates, ChordTranscriber().chord_templates)
+        self.assertIs(get_chord_transcriber(44100), get_chord_transcriber(44100))
+        self.assertIsNot(get_chord_transcriber(44100, 2048, CHORD_DICT_CUSTOM), get_chord_transcriber(44100))
+
+    @patch('librosa.cqt')
+    def test_extract_chroma_single_cqt(self, mock_cqt):
+        mock_cqt.return_value = np.random.default_rng(2).random((180, 50))
+        chroma = ChordTranscriber().extract_chroma(np.zeros(44100))
+        mock_cqt.assert_called_once()
+        self.assertEqual(mock_cqt.call_args.kwargs['n_bins'], 180)
+        self.assertEqual(chroma.shape, (50, 24))
+        # Bass and treble halves are each normalized to a per-frame max of 1
+        np.testing.assert_allclose(chroma[:, :12].max(axis=1), 1.0)
+        np.testing.assert_allclose(chroma[:, 12:].max(axis=1), 1.0)
+
     @patch('librosa.cqt')
     @patch('librosa.beat.beat_track')
     @patch('librosa.util.sync')
@@ -70,7 +286,7 @@ class TestAlgorithms(unittest.TestCase):
         ct = ChordTranscriber()
         
         # Mocking necessary returns
-        mock_cqt.return_value = np.zeros((144, 100))
+        mock_cqt.return_value = np.zeros((180, 100))
         mock_beat.return_value = (120, np.array([0, 10, 20]))
         # sync returns (n_channels, n_subs), so (24, 8) here
         mock_sync.return_value = np.zeros((24, 8)) 
@@ -79,7 +295,127 @@ class TestAlgorithms(unittest.TestCase):
         results = ct.transcribe(audio)
         self.assertIsInstance(results, list)
 
-    @patch('librosa.load')
+    def test_float32_mode_keeps_chord_labels(self):
+        import librosa
+        reference_set = [
+            [('C2', 'C4', 'E4', 'G4'), ('A1', 'A3', 'C4', 'E4'), ('F2', 'F3', 'A3', 'C4'), ('G2', 'G3', 'B3', 'D4')],
+            [('D2', 'D4', 'F#4', 'A4'), ('B1', 'B3', 'D4', 'F#4'), ('E2', 'E3', 'G3', 'B3'), ('A1', 'A3', 'C#4', 'E4')],
+        ]
+        for chords in reference_set:
+            audio = synthesize_progression(chords * 2)
+            beat_frames = librosa.time_to_frames(np.arange(0, len(audio) / 44100, 0.5), sr=44100, hop_length=2048)
+            ct64, ct32 = ChordTranscriber(), ChordTranscriber(dtype=np.float32)
+            chroma = ct32.extract_chroma(audio)
+            self.assertEqual(chroma.dtype, np.float32)
+            # Decoding stays in single precision too
+            with np.errstate(divide='ignore'):
+                log_obs = np.log(ct32._observation_likelihoods(chroma))
+            delta = ct32._viterbi_init(log_obs[0])
+            for t in range(1, 20):
+                delta, _ = ct32._viterbi_step(delta, t, log_obs[t])
+            self.assertEqual(delta.dtype, np.float32)
+            self.assertEqual(ct64.transcribe(audio, beat_frames=beat_frames),
+                             ct32.transcribe(audio, beat_frames=beat_frames))
+
+    def test_viterbi_online_matches_batch_decode(self):
+        ct = ChordTranscriber()
+        rng = np.random.default_rng(3)
+        sims = np.power(1.6, np.clip(rng.normal(8.0, 4.0, (120, len(ct.chord_names))), 0.0, 200.0))
+        obs_matrix = sims / np.sum(sims, axis=1, keepdims=True)
+        batch = ct._viterbi(obs_matrix)
+        np.testing.assert_array_equal(list(ct._viterbi_online(iter(obs_matrix), lag=200)), batch)
+        np.testing.assert_array_equal(list(ct._viterbi_online(iter(obs_matrix), lag=120)), batch)
+        self.assertEqual(len(list(ct._viterbi_online(iter(obs_matrix), lag=16))), len(batch))
+
+    def test_transcribe_stream(self):
+        chords = [('C2', 'C4', 'E4', 'G4'), ('A1', 'A3', 'C4', 'E4'), ('F2', 'F3', 'A3', 'C4'), ('G2', 'G3', 'B3', 'D4')]
+        audio = synthesize_progression(chords * 4, beat_clicks=True)
+        ct = ChordTranscriber()
+        segments = list(ct.transcribe_stream((audio[i:i + 12345] for i in range(0, len(audio), 12345)), block_seconds=10.0))
+        # Analysis windows do not depend on how the input is chunked
+        self.assertEqual(segments, list(ct.transcribe_stream(iter([audio]), block_seconds=10.0)))
+        self.assertEqual(segments[0]['start'], 0.0)
+        self.assertAlmostEqual(segments[-1]['end'], len(audio) / 44100)
+        for prev, seg in zip(segments, segments[1:]):
+            self.assertEqual(prev['end'], seg['start'])
+        self.assertTrue({'C', 'A', 'F', 'G'} <= {seg['chord'][0] for seg in segments})
+
+    def test_stream_windows_chroma_matches_whole_file(self):
+        chords = [('C2', 'C4', 'E4', 'G4'), ('A1', 'A3', 'C4', 'E4'), ('F2', 'F3', 'A3', 'C4'), ('G2', 'G3', 'B3', 'D4')]
+        audio = synthesize_progression(chords * 2, beat_clicks=True)
+        ct = ChordTranscriber()
+        block_len = int(5.0 * 44100 / ct.hop_size) * ct.hop_size
+        windowed = np.vstack([ct.extract_chroma(chunk)[core] for chunk, _, core, _ in
+                              ct._stream_windows(iter([audio]), block_len, context_frames=48)])
+        whole = ct.extract_chroma(audio)
+        self.assertEqual(windowed.shape, whole.shape)
+        # Seams are invisible; only the first half second sees different edge handling
+        np.testing.assert_allclose(windowed[16:], whole[16:], atol=1e-2)
+
+    def test_transcribe_stream_beatless_memory_is_bounded(self):
+        ct = ChordTranscriber()
+        sizes = []
+        def vstack(arrays):
+            stacked = real_vstack(arrays)
+            sizes.append(len(stacked))
+            return stacked
+        real_vstack = np.vstack
+        silence = (np.zeros(44100, dtype=np.float32) for _ in range(120))
+        with patch('core.nnls_chord_transcriber.np.vstack', side_effect=vstack):
+            segments = list(ct.transcribe_stream(silence, block_seconds=10.0))
+        # Without beats the chroma buffer is still released window by window (~215 frames each)
+        self.assertLess(max(sizes), 2 * 216)
+        self.assertEqual([seg['chord'] for seg in segments], ['N'])
+        self.assertAlmostEqual(segments[-1]['end'], 120.0)
+
+    def test_observation_likelihoods_match_pairwise_scores(self):
+        ct = ChordTranscriber()
+        chroma_subs = np.random.default_rng(1).random((20, 24))
+        obs_matrix = ct._observation_likelihoods(chroma_subs)
+        self.assertEqual(obs_matrix.shape, (20, len(ct.chord_names)))
+        for i in range(chroma_subs.shape[0]):
+            sims = np.zeros(len(ct.chord_names))
+            for j in range(len(ct.chord_names)):
+                sim = np.dot(chroma_subs[i], ct.chord_templates[j])
+                if ct.chord_names[j] == 'N': sim *= 0.6
+                sims[j] = np.power(1.6, max(0.0, min(200.0, sim)))
+            np.testing.assert_allclose(obs_matrix[i], sims / (np.sum(sims) + 1e-10), rtol=1e-12)
+
+    def test_viterbi_matches_reference_decoder(self):
+        ct = ChordTranscriber()
+        n_chords = len(ct.chord_names)
+        rng = np.random.default_rng(0)
+        sims = np.power(1.6, np.clip(rng.normal(8.0, 4.0, (300, n_chords)), 0.0, 200.0))
+        obs_matrix = sims / (np.sum(sims, axis=1, keepdims=True) + 1e-10)
+
+        # Per-state loop decoder the vectorized one replaced
+        def reference(obs_matrix, self_trans_prob=0.85):
+            n_subs = obs_matrix.shape[0]
+            delta, psi = np.zeros((n_subs, n_chords)), np.zeros((n_subs, n_chords), dtype=int)
+            delta[0, ct.chord_names.index('N')] = 1.0
+            delta[0] = delta[0] * obs_matrix[0]
+            delta[0] /= (np.sum(delta[0]) + 1e-10)
+            for t in range(1, n_subs):
+                stay_p = self_trans_prob
+                if (t % 16) == 0 or (t % 16) == 8: stay_p *= 0.8
+                elif (t % 4) == 0: stay_p *= 0.9
+                sw_p = (1.0 - stay_p) / (n_chords - 1)
+                for j in range(n_chords):
+                    sc = delta[t-1] * sw_p
+                    sc[j] = delta[t-1, j] * stay_p
+                    psi[t, j] = np.argmax(sc)
+                    delta[t, j] = sc[psi[t, j]] * obs_matrix[t, j]
+                delta[t] /= (np.sum(delta[t]) + 1e-10)
+            path = np.zeros(n_subs, dtype=int)
+            path[-1] = np.argmax(delta[-1])
+            for t in range(n_subs - 2, -1, -1): path[t] = psi[t+1, path[t+1]]
+            return path
+
+        for self_trans_prob in (0.85, 0.5, 0.99):
+            np.testing.assert_array_equal(ct._viterbi(obs_matrix, self_trans_prob),
+                                          reference(obs_matrix, self_trans_prob))
+
+    @patch('core.nnls_chord_transcriber.load_audio')
     @patch('core.nnls_chord_transcriber.ChordTranscriber.transcribe')
     @patch('librosa.beat.beat_track')
     def test_nnls_chord_transcribe_wrapper(self, mock_beat, mock_transcribe, mock_load):
@@ -90,6 +426,105 @@ class TestAlgorithms(unittest.TestCase):
         result = nnls_chord_transcribe("dummy.wav")
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0]['chord'], 'C')
+        self.assertEqual(mock_beat.call_count, 1)
+        np.testing.assert_array_equal(mock_transcribe.call_args.kwargs['beat_frames'], [0, 22050, 44100])
+
+    @patch('librosa.cqt')
+    @patch('librosa.beat.beat_track')
+    def test_transcribe_with_precomputed_beats(self, mock_beat, mock_cqt):
+        mock_cqt.return_value = np.zeros((180, 100))
+        ct = ChordTranscriber()
+        estimates, tempo, beat_frames = ct.transcribe(np.zeros(44100), beat_frames=np.array([0, 10, 20]),
+                                                      tempo=120.0, return_beats=True)
+        mock_beat.assert_not_called()
+        self.assertIsInstance(estimates, list)
+        self.assertEqual(tempo, 120.0)
+        np.testing.assert_array_equal(beat_frames, [0, 10, 20])
+
+    # --- Decoded Audio Cache Tests ---
+    def test_probe_audio_and_registered_hash(self):
+        import soundfile as sf
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "song.wav")
+            sf.write(path, np.zeros((44100, 2), dtype=np.float32), 44100)
+            self.assertEqual(probe_audio(path), {"duration": 1.0, "sample_rate": 44100, "channels": 2})
+            junk = os.path.join(tmp, "junk.wav")
+            Path(junk).write_bytes(b"not audio" * 10)
+            self.assertIsNone(probe_audio(junk))
+
+            real = content_hash(path)
+            register_content_hash(path, "registered")
+            self.assertEqual(content_hash(path), "registered")
+            # A rewritten file no longer matches its record
+            os.utime(path, ns=(1, 1))
+            self.assertEqual(content_hash(path), real)
+
+    def test_instrumentation_spans_and_progress(self):
+        # Outside recording() spans and progress reports are no-ops
+        with span("idle"):
+            report_progress(0.5)
+        events = []
+        with recording(on_progress=lambda fraction, message: events.append((fraction, message))) as recorder:
+            with span("outer"):
+                with span("inner"):
+                    report_progress(2.0, "clamped")
+        self.assertEqual([(s["name"], s["depth"]) for s in recorder.spans], [("inner", 1), ("outer", 0)])
+        self.assertEqual(events, [(1.0, "clamped")])
+
+        audio = synthesize_progression([["C3", "C4", "E4", "G4"], ["G2", "B3", "D4", "G4"]], beat_clicks=True)
+        transcriber = ChordTranscriber()
+        with recording() as recorder:
+            transcriber.transcribe(audio)
+        self.assertEqual({"cqt", "whiten", "beat_tracking", "obs_matrix", "viterbi"}, set(recorder.totals()))
+
+    def test_load_audio_cache(self):
+        from scipy.io import wavfile
+        with tempfile.TemporaryDirectory() as tmp:
+            wav_path = os.path.join(tmp, "no_vocals.wav")
+            wavfile.write(wav_path, 22050, (np.sin(np.arange(22050) * 0.05) * 10000).astype(np.int16))
+
+            y, sr = load_audio(wav_path, sr=44100)
+            self.assertEqual(sr, 44100)
+            self.assertEqual(y.dtype, np.float32)
+            self.assertEqual(len(list(Path(tmp, ".decoded").glob("*.npy"))), 1)
+
+            with patch('librosa.load') as mock_load:
+                y_cached, _ = load_audio(wav_path, sr=44100)
+                mock_load.assert_not_called()
+            self.assertIsInstance(y_cached, np.memmap)
+            np.testing.assert_array_equal(y_cached, y)
+
+            # Writing another entry over a zero budget empties the cache directory
+            load_audio(wav_path, sr=22050, max_bytes=0)
+            self.assertEqual(len(list(Path(tmp, ".decoded").glob("*.npy"))), 0)
+
+    def test_load_audio_cache_survives_concurrent_eviction(self):
+        from scipy.io import wavfile
+        from core.audio_cache import _evict
+        with tempfile.TemporaryDirectory() as tmp:
+            wav_path = os.path.join(tmp, "no_vocals.wav")
+            wavfile.write(wav_path, 22050, (np.sin(np.arange(22050) * 0.05) * 10000).astype(np.int16))
+            y, _ = load_audio(wav_path, sr=44100)
+
+            # Another worker deletes the entry between our lookup and np.load: decode again
+            real_load = np.load
+            calls = []
+            def evicted_once(*args, **kwargs):
+                calls.append(args)
+                if len(calls) == 1:
+                    raise FileNotFoundError()
+                return real_load(*args, **kwargs)
+            with patch('core.audio_cache.np.load', side_effect=evicted_once):
+                y_again, _ = load_audio(wav_path, sr=44100)
+            self.assertEqual(len(calls), 2)
+            np.testing.assert_array_equal(y_again, y)
+
+            # Files that vanish while eviction is scanning are skipped
+            cache_dir = Path(tmp, ".decoded")
+            gone = cache_dir / "gone.npy"
+            with patch.object(Path, 'glob', return_value=[gone, *cache_dir.glob("*.npy")]):
+                _evict(cache_dir, 0)
+            self.assertEqual(len(list(cache_dir.glob("*.npy"))), 0)
 
     # --- Whisper Lyrics Transcriber Tests ---
     @patch('core.whisper_lyrics_transcriber.is_available')
@@ -104,6 +539,45 @@ class TestAlgorithms(unittest.TestCase):
         self.assertIsNotNone(result)
         self.assertEqual(result[0]['text'], "Hello")
 
+    @patch('core.whisper_lyrics_transcriber.WHISPER_SERVER_PORT', '8178')
+    @patch('core.whisper_lyrics_transcriber.ensure_whisper_server', return_value=True)
+    @patch('core.whisper_lyrics_transcriber.is_available')
+    @patch('requests.post')
+    @patch('subprocess.run')
+    def test_whisper_server_backend(self, mock_run, mock_post, mock_available, mock_server):
+        mock_available.return_value = (True, "/tmp/models")
+        mock_post.return_value = MagicMock(json=lambda: {"segments": [{"start": 61.5, "end": 63.25, "text": "Hello"}]})
+        with tempfile.TemporaryDirectory() as tmp:
+            vocals = Path(tmp, "vocals.wav")
+            vocals.write_bytes(b"RIFF")
+            with patch('os.path.exists', return_value=True):
+                result = whisper_lyrics_transcribe(vocals, tmp, language="en")
+        mock_run.assert_not_called()
+        self.assertEqual(mock_post.call_args.kwargs['data']['language'], "en")
+        self.assertEqual(result, [{"timestamps": {"from": "00:01:01,500", "to": "00:01:03,250"},
+                                   "offsets": {"from": 61500, "to": 63250}, "text": "Hello"}])
+
+    # --- Capability Registry Tests ---
+    def test_capability_registry_caches_probes(self):
+        from core import capabilities
+        probe = MagicMock(return_value=True)
+        with patch.dict(capabilities.PROBES, {'demucs': probe}):
+            capabilities.refresh()
+            self.assertTrue(capabilities.capability('demucs'))
+            self.assertTrue(capabilities.capability('demucs'))
+            self.assertEqual(probe.call_count, 1)
+
+            capabilities.refresh('demucs')
+            capabilities.capability('demucs')
+            self.assertEqual(probe.call_count, 2)
+
+            # Entries stored with ttl=0 expire immediately
+            capabilities.refresh('demucs')
+            capabilities.capability('demucs', ttl=0)
+            capabilities.capability('demucs', ttl=0)
+            self.assertEqual(probe.call_count, 4)
+            capabilities.refresh()
+
     # --- Services Tests ---
     
     @patch('core.services.demucs_source_separate')
@@ -121,6 +595,25 @@ class TestAlgorithms(unittest.TestCase):
         mock_whisper.assert_called_with("v.wav", "/tmp/media", model_name="base", language="en")
         self.assertEqual(result[0]['text'], "Hello")
 
+    @patch('core.services.nnls_chord_transcribe')
+    @patch('core.services.analyze_beats')
+    @patch('core.services.vamp_chord_transcribe')
+    @patch('core.services.vamp_available')
+    @patch('core.services.load_audio')
+    def test_service_recognize_chords_vamp(self, mock_load, mock_vamp_ok, mock_vamp, mock_beats, mock_nnls):
+        audio = np.zeros(44100)
+        mock_load.return_value = (audio, 44100)
+        mock_vamp_ok.return_value = True
+        mock_vamp.return_value = [{'start': 0.0, 'end': 1.0, 'chord': 'C'}]
+        mock_beats.return_value = {'beats': [0.5], 'tempo': 120.0}
+        from core.services import recognize_chords
+        result = recognize_chords("nv.wav", algorithm='vamp')
+        mock_load.assert_called_once()
+        mock_vamp.assert_called_with("nv.wav", audio=audio, sr=44100)
+        mock_beats.assert_called_with(audio, 44100)
+        mock_nnls.assert_not_called()
+        self.assertEqual(result, {'chords': mock_vamp.return_value, 'beats': [0.5], 'tempo': 120.0})
+
 
 
 if __name__ == '__main__':
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from kombu import Queue
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -15,6 +16,14 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
+@app.on_after_configure.connect
+def declare_stage_queues(sender, **kwargs):
+    # Declare the default queue plus every routed stage queue, so that a worker
+    # started without -Q still consumes all of them.
+    queues = {sender.conf.task_default_queue}
+    queues.update(route['queue'] for route in (sender.conf.task_routes or {}).values())
+    sender.conf.task_queues = [Queue(name) for name in sorted(queues)]
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
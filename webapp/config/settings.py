@@ -91,3 +91,33 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Pipeline stages run on their own queues so worker pools can be sized independently, e.g.
+#   celery -A config worker -Q separation -c 1
+#   celery -A config worker -Q default,lyrics,chords,notes -c 4
+# A worker started without -Q consumes every queue (see config/celery.py).
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_ROUTES = {
+    'transcriber.tasks.separate_stage': {'queue': 'separation'},
+    'transcriber.tasks.transcribe_lyrics_stage': {'queue': 'lyrics'},
+    'transcriber.tasks.recognize_chords_stage': {'queue': 'chords'},
+    'transcriber.tasks.transcribe_notes_stage': {'queue': 'notes'},
+}
+# Stage tasks run for minutes: take one at a time and acknowledge on completion
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_ACKS_LATE = True
+
+
+# Progress events go out over Redis pub/sub, streamed by /pipeline/events/ under ASGI (under WSGI
+# clients poll pipeline_status instead); the database copy is written at most once per interval
+# per task, plus once at every stage boundary
+PROGRESS_REDIS_URL = CELERY_BROKER_URL
+PROGRESS_DB_INTERVAL = 2.0
+
+# start_pipeline attaches to an unfinished identical task only if it started within this many
+# seconds; older ones are presumed lost with their worker, marked failed, and the audio is processed again
+PIPELINE_DEDUP_INFLIGHT_TIMEOUT = 2 * 3600
+
+# Uploads are streamed to MEDIA_ROOT by transcriber.uploads.AudioUploadHandler and rejected
+# there (before any worker sees them) when larger or longer than this
+UPLOAD_MAX_BYTES = 200 * 1024 ** 2
+UPLOAD_MAX_SECONDS = 30 * 60
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcriber', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcriptiontask',
+            name='task_type',
+            field=models.CharField(choices=[('pipeline', 'Full Pipeline'), ('stems', 'Stem Separation'), ('lyrics', 'Lyrics Transcription'), ('chords', 'Chord Recognition'), ('notes', 'Note Transcription')], default='pipeline', max_length=20),
+        ),
+    ]
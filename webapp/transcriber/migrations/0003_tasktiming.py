@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcriber', '0002_transcriptiontask_task_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskTiming',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(max_length=50)),
+                ('name', models.CharField(max_length=100)),
+                ('start', models.FloatField()),
+                ('duration', models.FloatField()),
+                ('depth', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timings', to='transcriber.transcriptiontask')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['stage', 'name'], name='transcriber_stage_bcbd2c_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcriber', '0003_tasktiming'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcriptiontask',
+            name='chord_algorithm',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='transcriptiontask',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='transcriptiontask',
+            name='language',
+            field=models.CharField(blank=True, max_length=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='transcriptiontask',
+            name='versions',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='transcriptiontask',
+            index=models.Index(fields=['content_hash', 'chord_algorithm', 'language', 'versions'], name='task_dedup_idx'),
+        ),
+    ]
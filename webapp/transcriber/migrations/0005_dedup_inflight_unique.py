@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcriber', '0004_transcriptiontask_dedup'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='transcriptiontask',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['PENDING', 'PROCESSING']), ('task_type', 'pipeline')), fields=('content_hash', 'chord_algorithm', 'language', 'versions'), name='task_dedup_inflight_uniq'),
+        ),
+    ]
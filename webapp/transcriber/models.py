@@ -8,17 +8,53 @@ class TranscriptionTask(models.Model):
         ('SUCCESS', 'Success'),
         ('FAILURE', 'Failure'),
     ]
+    TYPE_CHOICES = [
+        ('pipeline', 'Full Pipeline'),
+        ('stems', 'Stem Separation'),
+        ('lyrics', 'Lyrics Transcription'),
+        ('chords', 'Chord Recognition'),
+        ('notes', 'Note Transcription'),
+    ]
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     original_filename = models.CharField(max_length=255)
     audio_file_path = models.CharField(max_length=500)
+    task_type = models.CharField(max_length=20, choices=TYPE_CHOICES, default='pipeline')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
     progress = models.IntegerField(default=0)  # 0-100
     current_step = models.CharField(max_length=100, blank=True, null=True)
     result_json = models.JSONField(blank=True, null=True)
+    # Dedup key: the same audio analysed the same way gives the same result
+    content_hash = models.CharField(max_length=64, blank=True, null=True)
+    chord_algorithm = models.CharField(max_length=20, blank=True, null=True)
+    language = models.CharField(max_length=10, blank=True, null=True)
+    versions = models.CharField(max_length=64, blank=True, null=True)
     error_message = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['content_hash', 'chord_algorithm', 'language', 'versions'], name='task_dedup_idx')]
+        # At most one unfinished pipeline per dedup key, so simultaneous identical requests share it
+        constraints = [models.UniqueConstraint(
+            fields=['content_hash', 'chord_algorithm', 'language', 'versions'], name='task_dedup_inflight_uniq',
+            condition=models.Q(task_type='pipeline', status__in=['PENDING', 'PROCESSING']))]
+
     def __str__(self):
         return f"{self.original_filename} ({self.status})"
+
+class TaskTiming(models.Model):
+    """One timing span of a task stage (see core/instrumentation.py); start is relative to the stage."""
+    task = models.ForeignKey(TranscriptionTask, related_name='timings', on_delete=models.CASCADE)
+    stage = models.CharField(max_length=50)
+    name = models.CharField(max_length=100)
+    start = models.FloatField()
+    duration = models.FloatField()
+    depth = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['stage', 'name'])]
+
+    def __str__(self):
+        return f"{self.stage}/{self.name}: {self.duration:.3f}s"
@@ -0,0 +1,66 @@
+import json
+import functools
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+# Terminal states end a progress stream
+FINISHED = ('SUCCESS', 'FAILURE')
+
+def channel_name(task_id):
+    return f"transcriber:progress:{task_id}"
+
+@functools.lru_cache(maxsize=1)
+def redis_client():
+    return redis.Redis.from_url(settings.PROGRESS_REDIS_URL)
+
+def publish_progress(task_id, **event):
+    """
+    Publishes a partial task state ({progress, current_step} or {status, error_message})
+    to the task's channel. Progress is best effort: a Redis hiccup never fails a stage.
+    """
+    try:
+        redis_client().publish(channel_name(task_id), json.dumps(event))
+    except redis.RedisError as e:
+        print(f"Progress Error: {e}")
+
+def combined_progress(task_id, part, fraction, parts):
+    """
+    How far (0-1) a group of `parts` stages running in parallel on one task has got,
+    now that `part` has reached `fraction`; parts yet to report count as 0. Falls back
+    to this part's own share when Redis is unavailable, so it never overstates.
+    """
+    key = f"{channel_name(task_id)}:parts"
+    try:
+        client = redis_client()
+        client.hset(key, part, fraction)
+        client.expire(key, 24 * 3600)
+        done = sum(float(v) for v in client.hvals(key))
+    except redis.RedisError as e:
+        print(f"Progress Error: {e}")
+        done = fraction
+    return min(done / parts, 1.0)
+
+async def progress_events(task_id, snapshot, keepalive=15.0):
+    """
+    Yields Server-Sent Events for a task: the current snapshot first, then every
+    published event until the task finishes. Comment lines keep idle proxies open.
+    """
+    client = aioredis.Redis.from_url(settings.PROGRESS_REDIS_URL)
+    pubsub = client.pubsub()
+    try:
+        # Subscribe before reading the snapshot so nothing published in between is lost
+        await pubsub.subscribe(channel_name(task_id))
+        state = await snapshot()
+        yield f"data: {json.dumps(state)}\n\n"
+        while state.get('status') not in FINISHED:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=keepalive)
+            if message is None:
+                yield ": keep-alive\n\n"
+                continue
+            event = json.loads(message['data'])
+            state.update(event)
+            yield f"data: {json.dumps(event)}\n\n"
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
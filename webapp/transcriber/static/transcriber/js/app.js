@@ -16,6 +16,13 @@ function getCookie(name) {
     return cookieValue;
 }
 
+// Uploads are rejected (413/415) before reaching a worker; show why
+function uploadFailed(xhr) {
+    let message = 'Upload failed.';
+    try { message = JSON.parse(xhr.responseText).message || message; } catch (e) { }
+    alert(message);
+}
+
 function selectSong(filePath, fileName) {
     // Update all file_path inputs
     document.querySelectorAll('input[name="file_path"]').forEach(i => i.value = filePath);
@@ -47,6 +54,7 @@ function startPipeline() {
     formData.append('file_name', fileName);
     formData.append('chord_algorithm', document.getElementById('pipeline-chord-algo').value);
     formData.append('language', document.getElementById('pipeline-lang').value);
+    formData.append('demucs_preset', document.getElementById('pipeline-demucs-preset').value);
 
     fetch('/pipeline/start/', {
         method: 'POST',
@@ -59,7 +67,7 @@ function startPipeline() {
         .then(data => {
             if (data.status === 'success') {
                 document.getElementById('pipeline-progress-box').classList.remove('hidden');
-                pollTaskStatus(data.task_id);
+                watchTask(data.task_id);
             } else {
                 alert('Error starting pipeline: ' + data.message);
                 document.getElementById('pipeline-cta').classList.remove('hidden');
@@ -72,24 +80,49 @@ function startPipeline() {
         });
 }
 
+// Shows a task state; returns true once the task has finished either way
+function renderTaskState(taskId, data) {
+    document.getElementById('pipeline-percent').textContent = data.progress + '%';
+    document.getElementById('pipeline-progress-bar').value = data.progress;
+    document.getElementById('pipeline-step-msg').textContent = data.current_step || 'Processing...';
+
+    if (data.status === 'SUCCESS') {
+        loadPipelineResult(taskId);
+        return true;
+    } else if (data.status === 'FAILURE') {
+        alert("Pipeline Failed: " + data.error_message);
+        document.getElementById('pipeline-cta').classList.remove('hidden');
+        document.getElementById('pipeline-progress-box').classList.add('hidden');
+        return true;
+    }
+    return false;
+}
+
+// Progress is pushed over Server-Sent Events; falls back to polling when the stream is unavailable
+// (a WSGI deployment answers 204, which closes the EventSource without reconnecting)
+function watchTask(taskId) {
+    if (!window.EventSource) return pollTaskStatus(taskId);
+
+    const state = {};
+    let finished = false;
+    const source = new EventSource(`/pipeline/events/${taskId}/`);
+    source.onmessage = (event) => {
+        Object.assign(state, JSON.parse(event.data));
+        finished = renderTaskState(taskId, state);
+        if (finished) source.close();
+    };
+    source.onerror = () => {
+        source.close();
+        if (!finished) pollTaskStatus(taskId);
+    };
+}
+
 function pollTaskStatus(taskId) {
     const interval = setInterval(() => {
         fetch(`/pipeline/status/${taskId}/`)
             .then(r => r.json())
             .then(data => {
-                document.getElementById('pipeline-percent').textContent = data.progress + '%';
-                document.getElementById('pipeline-progress-bar').value = data.progress;
-                document.getElementById('pipeline-step-msg').textContent = data.current_step || 'Processing...';
-
-                if (data.status === 'SUCCESS') {
-                    clearInterval(interval);
-                    loadPipelineResult(taskId);
-                } else if (data.status === 'FAILURE') {
-                    clearInterval(interval);
-                    alert("Pipeline Failed: " + data.error_message);
-                    document.getElementById('pipeline-cta').classList.remove('hidden');
-                    document.getElementById('pipeline-progress-box').classList.add('hidden');
-                }
+                if (renderTaskState(taskId, data)) clearInterval(interval);
             });
     }, 2000);
 }
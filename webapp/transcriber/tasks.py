@@ -1,39 +1,174 @@
-from celery import shared_task
-from .models import TranscriptionTask
+from celery import shared_task, chord
+from .models import TranscriptionTask, TaskTiming
 from core.services import separate_sources, transcribe_lyrics, recognize_chords
+from core.basic_pitch_transcriber import basic_pitch_notes, notes_to_json
+from core.instrumentation import recording, span
+from .progress import publish_progress, combined_progress
 from django.conf import settings
+from django.utils import timezone
 import os
+import json
+import time
+import hashlib
+import contextlib
 
-@shared_task(bind=True)
-def process_audio_pipeline(self, task_id, chord_algorithm='nnls', language='zh'):
+# Each stage task is routed to its own queue (CELERY_TASK_ROUTES in config/settings.py),
+# so heavy separation and light analysis can run on separately sized worker pools.
+
+# task_id -> time of the last progress row write in this worker process
+_progress_written = {}
+
+def set_status(task_id, status, **fields):
+    """Writes the status (and given fields) without rereading the row, and announces it."""
+    TranscriptionTask.objects.filter(id=task_id).update(status=status, updated_at=timezone.now(), **fields)
+    _progress_written.pop(task_id, None)
+    publish_progress(task_id, status=status, **{k: v for k, v in fields.items() if k != 'result_json'})
+
+def mark_failed(task_id, message):
+    try:
+        set_status(task_id, 'FAILURE', error_message=message)
+    except:
+        pass
+    print(f"Task Error: {message}")
+
+def update_progress(task_id, percent, step, force=False):
+    """
+    Progress goes to subscribers on every call. The row (read by pipeline_status) only
+    gets the two progress columns at most every PROGRESS_DB_INTERVAL seconds, since
+    sub-progress messages change with every call; force writes stage milestones anyway.
+    """
+    publish_progress(task_id, progress=percent, current_step=step)
+    now = time.monotonic()
+    if not force and now - _progress_written.get(task_id, float('-inf')) < settings.PROGRESS_DB_INTERVAL:
+        return
+    if len(_progress_written) > 1000:  # entries of tasks finished in other workers
+        _progress_written.clear()
+    _progress_written[task_id] = now
+    TranscriptionTask.objects.filter(id=task_id).update(progress=percent, current_step=step)
+
+@contextlib.contextmanager
+def instrumented(task_id, stage, progress_range=(0, 100), progress_parts=1):
+    """
+    Runs a stage under a core instrumentation recorder: its timing spans are stored as
+    TaskTiming rows (the stage itself is the depth-0 span) and its sub-progress (0-1)
+    is mapped onto progress_range of the task's percent. progress_parts > 1 means that
+    many stages run in parallel over the same range, and their fractions are combined.
+    """
+    if task_id is None:
+        yield
+        return
+    low, high = progress_range
+
+    def on_progress(fraction, message):
+        if progress_parts > 1:
+            fraction = combined_progress(task_id, stage, fraction, progress_parts)
+        update_progress(task_id, int(low + fraction * (high - low)), f"{stage.capitalize()}: {message or 'running'}")
+
+    recorder = None
     try:
-        task = TranscriptionTask.objects.get(id=task_id)
-        task.status = 'PROCESSING'
-        task.save()
+        with recording(on_progress) as recorder, span(stage):
+            yield
+        if progress_parts > 1:
+            on_progress(1.0, 'done')  # a finished part counts in full even if it never reported
+    finally:
+        if recorder is not None:
+            TaskTiming.objects.bulk_create([TaskTiming(task_id=task_id, stage=stage, **s) for s in recorder.spans])
 
-        def update_progress(percent, step):
-            task.progress = percent
-            task.current_step = step
-            task.save()
+def enqueue_stage(task_id, stage, step, failure_message):
+    """
+    Runs a single stage for a stand-alone request (stems, lyrics, chords, notes tabs)
+    and stores its return value as the task result, polled like a pipeline task.
+    """
+    update_progress(task_id, 0, step, force=True)
+    (stage | store_stage_result.s(task_id, failure_message)) \
+        .on_error(pipeline_failed.s(task_id=task_id)).apply_async()
 
-        update_progress(10, "Separating audio sources...")
+@shared_task
+def store_stage_result(result, task_id, failure_message='Stage failed'):
+    if result is None:
+        mark_failed(task_id, failure_message)
+        return
+    set_status(task_id, 'SUCCESS', result_json=result, progress=100)
+
+# Bump when a change to the stages alters pipeline results, so stored results stop being reused
+PIPELINE_VERSION = 1
+
+def result_versions(demucs_options=None):
+    """
+    Fingerprint of everything besides audio, algorithm and language that shapes a pipeline
+    result: the pipeline version and the Demucs settings that produced the stems
+    (threads/jobs only change speed, so they are left out).
+    """
+    demucs = {k: v for k, v in (demucs_options or {}).items() if k not in ('threads', 'jobs')}
+    payload = json.dumps({"pipeline": PIPELINE_VERSION, "demucs": demucs}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+@shared_task(bind=True)
+def process_audio_pipeline(self, task_id, chord_algorithm='nnls', language='zh', demucs_options=None):
+    """
+    Pipeline entry point: separate -> (lyrics || chords) -> finalize.
+    Only schedules the stages, so it never blocks a worker for long.
+    """
+    try:
+        set_status(task_id, 'PROCESSING')
+        update_progress(task_id, 10, "Separating audio sources...", force=True)
+        (separate_stage.s(task_id, demucs_options, progress_range=(10, 40)) | analyze_stems.s(task_id, chord_algorithm, language)) \
+            .on_error(pipeline_failed.s(task_id=task_id)).apply_async()
         
-        # 1. Source Separation
-        stems = separate_sources(task.audio_file_path, settings.MEDIA_ROOT)
+    except Exception as e:
+        mark_failed(task_id, str(e))
+
+@shared_task
+def separate_stage(task_id, demucs_options=None, progress_range=(0, 100)):
+    # 1. Source Separation
+    task = TranscriptionTask.objects.get(id=task_id)
+    with instrumented(task_id, 'separation', progress_range):
+        return separate_sources(task.audio_file_path, settings.MEDIA_ROOT, **(demucs_options or {}))
+
+@shared_task
+def analyze_stems(stems, task_id, chord_algorithm='nnls', language='zh'):
+    try:
         vocals_path = stems['vocals']
         accompaniment_path = stems['no_vocals']
-        
-        update_progress(40, f"Transcribing lyrics from vocals ({language})...")
-        
-        # 2. Lyrics Transcription
-        lyrics_data = transcribe_lyrics(vocals_path, settings.MEDIA_ROOT, language=language)
-        
-        update_progress(70, "Recognizing chords from accompaniment...")
-        
-        # 3. Chord Recognition
-        chord_results = recognize_chords(accompaniment_path, algorithm=chord_algorithm)
-        
-        update_progress(90, "Aligning results...")
+
+        update_progress(task_id, 40, f"Transcribing lyrics ({language}) and recognizing chords...", force=True)
+
+        # 2. Lyrics Transcription and 3. Chord Recognition read different stems,
+        # so they run concurrently and finalize_pipeline merges both results; they share
+        # 40-90 %, which only reaches 90 once both are done
+        chord([
+            transcribe_lyrics_stage.s(vocals_path, language, task_id=task_id, progress_range=(40, 90), progress_parts=2),
+            recognize_chords_stage.s(accompaniment_path, chord_algorithm, task_id=task_id, progress_range=(40, 90),
+                                     progress_parts=2),
+        ])(finalize_pipeline.s(task_id, vocals_path, accompaniment_path).on_error(pipeline_failed.s(task_id=task_id)))
+
+    except Exception as e:
+        mark_failed(task_id, str(e))
+
+@shared_task
+def transcribe_lyrics_stage(vocals_path, language='zh', model_name='base', task_id=None, progress_range=(0, 100),
+                            progress_parts=1):
+    with instrumented(task_id, 'lyrics', progress_range, progress_parts):
+        return transcribe_lyrics(vocals_path, settings.MEDIA_ROOT, language=language, model_name=model_name)
+
+@shared_task
+def recognize_chords_stage(accompaniment_path, chord_algorithm='nnls', task_id=None, progress_range=(0, 100),
+                           progress_parts=1):
+    with instrumented(task_id, 'chords', progress_range, progress_parts):
+        return {**recognize_chords(accompaniment_path, algorithm=chord_algorithm), 'algorithm': chord_algorithm}
+
+@shared_task
+def transcribe_notes_stage(input_path, notes_id, task_id=None, progress_range=(0, 100)):
+    # Stores the note events (.npy + .mid); audio is only synthesized on playback
+    output_paths = [os.path.join(settings.MEDIA_ROOT, f"notes_{notes_id}{ext}") for ext in ('.npy', '.mid')]
+    with instrumented(task_id, 'notes', progress_range):
+        notes = basic_pitch_notes(input_path, output_paths)
+    return {'notes_id': notes_id, 'notes': notes_to_json(notes)}
+
+@shared_task
+def finalize_pipeline(stage_results, task_id, vocals_path, accompaniment_path):
+    try:
+        lyrics_data, chord_results = stage_results
 
         results = {
             "audio_url": None,
@@ -46,17 +181,11 @@ def process_audio_pipeline(self, task_id, chord_algorithm='nnls', language='zh')
             "accompaniment_path": accompaniment_path,
         }
         
-        task.result_json = results
-        task.status = 'SUCCESS'
-        task.progress = 100
-        task.save()
+        set_status(task_id, 'SUCCESS', result_json=results, progress=100)
         
     except Exception as e:
-        try:
-            task = TranscriptionTask.objects.get(id=task_id)
-            task.status = 'FAILURE'
-            task.error_message = str(e)
-            task.save()
-        except:
-            pass
-        print(f"Task Error: {e}")
+        mark_failed(task_id, str(e))
+
+@shared_task
+def pipeline_failed(request, exc, traceback, task_id=None):
+    mark_failed(task_id, str(exc))
@@ -0,0 +1,328 @@
+import io
+import os
+import json
+import tempfile
+from datetime import timedelta
+from unittest.mock import patch, MagicMock, AsyncMock
+import numpy as np
+import soundfile as sf
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient, Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from core.audio_cache import content_hash
+from core.instrumentation import report_progress
+from .models import TranscriptionTask
+from . import tasks
+from .tasks import result_versions, update_progress, set_status, mark_failed, store_stage_result, instrumented
+from .uploads import sniff_audio
+from .views import claim_pipeline_task, find_pipeline_task
+
+@patch('transcriber.views.process_audio_pipeline.delay')
+class PipelineDedupTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.audio_path = os.path.join(tmp.name, 'song.wav')
+        with open(self.audio_path, 'wb') as f:
+            f.write(b'RIFF\0\0\0\0WAVE same audio')
+        self.key = {'content_hash': content_hash(self.audio_path), 'chord_algorithm': 'nnls',
+                    'language': 'zh', 'versions': result_versions({'preset': 'default'})}
+
+    def start(self, **params):
+        response = self.client.post(reverse('start_pipeline'), {
+            'file_path': self.audio_path, 'chord_algorithm': 'nnls', 'language': 'zh', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_request_creates_a_task(self, mock_delay):
+        data = self.start()
+        self.assertNotIn('deduplicated', data)
+        task = TranscriptionTask.objects.get(id=data['task_id'])
+        self.assertEqual({k: getattr(task, k) for k in self.key}, self.key)
+        mock_delay.assert_called_once()
+
+    def test_finished_task_is_reused(self, mock_delay):
+        TranscriptionTask.objects.create(status='PROCESSING', **self.key)
+        done = TranscriptionTask.objects.create(status='SUCCESS', result_json={}, **self.key)
+        data = self.start()
+        # A finished result wins over an identical run still in flight
+        self.assertEqual(data, {'status': 'success', 'task_id': str(done.id), 'deduplicated': True})
+        mock_delay.assert_not_called()
+
+    def test_in_flight_task_is_attached_to(self, mock_delay):
+        running = TranscriptionTask.objects.create(status='PROCESSING', **self.key)
+        self.assertEqual(self.start()['task_id'], str(running.id))
+        mock_delay.assert_not_called()
+
+    @override_settings(PIPELINE_DEDUP_INFLIGHT_TIMEOUT=60)
+    def test_stale_in_flight_task_is_ignored(self, mock_delay):
+        stale = TranscriptionTask.objects.create(status='PENDING', **self.key)
+        TranscriptionTask.objects.filter(id=stale.id).update(created_at=timezone.now() - timedelta(seconds=61))
+        self.assertIsNone(find_pipeline_task(**self.key))
+        self.assertNotEqual(self.start()['task_id'], str(stale.id))
+        mock_delay.assert_called_once()
+        # The lost task gives up its key so the new one can hold it
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'FAILURE')
+
+    def test_simultaneous_requests_share_one_task(self, mock_delay):
+        first, created = claim_pipeline_task(self.key)
+        self.assertTrue(created)
+        # The second request looked before the first one's task existed
+        with patch('transcriber.views.find_pipeline_task', side_effect=[None, first]):
+            second, created = claim_pipeline_task(self.key)
+        self.assertFalse(created)
+        self.assertEqual(second.id, first.id)
+        self.assertEqual(TranscriptionTask.objects.count(), 1)
+
+    def test_failed_task_is_never_reused(self, mock_delay):
+        failed = TranscriptionTask.objects.create(status='FAILURE', **self.key)
+        self.assertIsNone(find_pipeline_task(**self.key))
+        self.assertNotEqual(self.start()['task_id'], str(failed.id))
+        mock_delay.assert_called_once()
+
+    def test_other_task_types_are_not_reused(self, mock_delay):
+        TranscriptionTask.objects.create(task_type='chords', status='SUCCESS', **self.key)
+        self.assertIsNone(find_pipeline_task(**self.key))
+
+    def test_versions_ignore_threads_and_jobs(self, mock_delay):
+        self.assertEqual(result_versions({'preset': 'default', 'threads': 4, 'jobs': 2}), self.key['versions'])
+        self.assertNotEqual(result_versions({'preset': 'fast'}), self.key['versions'])
+        done = TranscriptionTask.objects.create(status='SUCCESS', **self.key)
+        self.assertEqual(self.start(demucs_threads='4', demucs_jobs='2')['task_id'], str(done.id))
+        self.assertNotEqual(self.start(demucs_preset='fast')['task_id'], str(done.id))
+
+def wav_bytes(seconds, sr=8000):
+    buf = io.BytesIO()
+    sf.write(buf, np.zeros(int(seconds * sr), dtype=np.float32), sr, format='WAV')
+    return buf.getvalue()
+
+class AudioUploadTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media_root = tmp.name
+        settings = override_settings(MEDIA_ROOT=self.media_root, UPLOAD_MAX_BYTES=100_000, UPLOAD_MAX_SECONDS=2)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def upload(self, name, data, client=None):
+        return (client or self.client).post(reverse('upload_audio'), {'audio': SimpleUploadedFile(name, data)})
+
+    def stored_files(self):
+        return sorted(p for p in os.listdir(self.media_root) if p != '.hashes')
+
+    def test_sniff_audio(self):
+        self.assertTrue(sniff_audio(wav_bytes(0.1)[:12]))
+        for head in (b'fLaC', b'OggS', b'ID3\x04', b'\xff\xfb\x90\x00', b'\0\0\0\x20ftypM4A '):
+            self.assertTrue(sniff_audio(head), head)
+        for head in (b'RIFF\0\0\0\0AVI ', b'<html>', b'%PDF-1.7', b''):
+            self.assertFalse(sniff_audio(head), head)
+
+    def test_valid_upload_is_stored_and_hashed(self):
+        data = wav_bytes(1.0)
+        response = self.upload('song.wav', data)
+        self.assertEqual(response.status_code, 200)
+        upload = response.json()
+        self.assertEqual((upload['duration'], upload['sample_rate'], upload['channels']), (1.0, 8000, 1))
+        self.assertEqual(self.stored_files(), [os.path.basename(upload['file_path'])])
+        with open(upload['file_path'], 'rb') as f:
+            self.assertEqual(f.read(), data)
+        # The hash computed while streaming is registered, so it never has to be recomputed
+        with patch('core.audio_cache.open', side_effect=AssertionError("file was reread")):
+            self.assertEqual(content_hash(upload['file_path']), upload['content_hash'])
+
+    def test_rejections_leave_no_files(self):
+        cases = [
+            ('song.exe', wav_bytes(1.0), 415),     # extension
+            ('song.wav', b'<html>' * 100, 415),    # signature
+            ('song.wav', wav_bytes(10.0), 413),    # byte cap (160 kB)
+            ('song.wav', wav_bytes(3.0), 413),     # duration cap
+            ('song.wav', b'RIFF\0\0\0\0WAVEjunk', 415),  # signature ok, header unreadable
+        ]
+        for name, data, status in cases:
+            with self.subTest(name=name, size=len(data)):
+                self.assertEqual(self.upload(name, data).status_code, status)
+                self.assertEqual(self.stored_files(), [])  # no .part left behind
+
+    def test_csrf_failure_discards_the_upload(self):
+        # A cookie but a wrong form token: the file is stored while the form is read for the check
+        client = Client(enforce_csrf_checks=True)
+        client.cookies['csrftoken'] = 'a' * 32
+        response = client.post(reverse('upload_audio'), {'audio': SimpleUploadedFile('song.wav', wav_bytes(1.0)),
+                                                         'csrfmiddlewaretoken': 'b' * 32})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.stored_files(), [])
+        self.assertEqual(os.listdir(os.path.join(self.media_root, '.hashes')), [])
+
+@override_settings(PROGRESS_DB_INTERVAL=2.0)
+class ProgressTests(TestCase):
+    def setUp(self):
+        self.task = TranscriptionTask.objects.create(status='PROCESSING')
+        self.redis = MagicMock()
+        patchers = [patch('transcriber.progress.redis_client', return_value=self.redis), patch('transcriber.tasks.time')]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.monotonic = tasks.time.monotonic
+        self.monotonic.return_value = 100.0
+        tasks._progress_written.clear()
+
+    def published(self):
+        return [json.loads(c.args[1]) for c in self.redis.publish.call_args_list]
+
+    def row(self):
+        self.task.refresh_from_db()
+        return self.task.progress, self.task.current_step
+
+    def test_row_writes_are_throttled_by_time(self):
+        update_progress(self.task.id, 10, 'Chords: chroma')
+        self.monotonic.return_value = 101.0
+        update_progress(self.task.id, 20, 'Chords: beats')
+        # Subscribers see every step; the row only the first one within the interval
+        self.assertEqual(self.published(), [{'progress': 10, 'current_step': 'Chords: chroma'},
+                                            {'progress': 20, 'current_step': 'Chords: beats'}])
+        self.assertEqual(self.row(), (10, 'Chords: chroma'))
+        self.monotonic.return_value = 102.5
+        update_progress(self.task.id, 30, 'Chords: decode')
+        self.assertEqual(self.row(), (30, 'Chords: decode'))
+
+    def test_forced_progress_is_always_written(self):
+        update_progress(self.task.id, 10, 'Separating audio sources...')
+        update_progress(self.task.id, 40, 'Transcribing lyrics', force=True)
+        self.assertEqual(self.row(), (40, 'Transcribing lyrics'))
+
+    def test_status_change_resets_the_throttle(self):
+        update_progress(self.task.id, 10, 'Separating audio sources...')
+        set_status(self.task.id, 'PROCESSING')
+        update_progress(self.task.id, 20, 'Separation: running')
+        self.assertEqual(self.row(), (20, 'Separation: running'))
+
+    def test_finished_events(self):
+        store_stage_result({'chords': []}, self.task.id)
+        other = TranscriptionTask.objects.create(status='PROCESSING')
+        mark_failed(other.id, 'Demucs failed')
+        # The result itself is not broadcast, only that the task finished
+        self.assertEqual(self.published(), [{'status': 'SUCCESS', 'progress': 100},
+                                            {'status': 'FAILURE', 'error_message': 'Demucs failed'}])
+        self.assertEqual([c.args[0] for c in self.redis.publish.call_args_list],
+                         [f'transcriber:progress:{self.task.id}', f'transcriber:progress:{other.id}'])
+        other.refresh_from_db()
+        self.assertEqual((other.status, other.error_message), ('FAILURE', 'Demucs failed'))
+
+    def test_parallel_stages_share_their_range(self):
+        parts = {}
+        self.redis.hset.side_effect = lambda key, field, value: parts.__setitem__(field, str(value))
+        self.redis.hvals.side_effect = lambda key: list(parts.values())
+        with instrumented(self.task.id, 'lyrics', (40, 90), progress_parts=2):
+            report_progress(0.5)
+            self.monotonic.return_value += 10
+            with instrumented(self.task.id, 'chords', (40, 90), progress_parts=2):
+                self.monotonic.return_value += 10
+                report_progress(1.0, 'Chords decoded')
+            # Chords are done, lyrics half way: 40 + 50 * (1.0 + 0.5) / 2
+            self.assertEqual(self.row(), (77, 'Chords: Chords decoded'))
+            self.monotonic.return_value += 10
+        self.assertEqual(self.row(), (90, 'Lyrics: done'))
+        self.assertEqual(self.redis.hset.call_args.args[0], f'transcriber:progress:{self.task.id}:parts')
+
+    def test_events_are_only_streamed_under_asgi(self):
+        # A WSGI worker would be blocked for the whole task: the client polls instead
+        self.assertEqual(self.client.get(reverse('pipeline_events', args=[self.task.id])).status_code, 204)
+
+    async def test_events_stream_under_asgi(self):
+        pubsub = MagicMock(subscribe=AsyncMock(), aclose=AsyncMock(),
+                           get_message=AsyncMock(side_effect=[None, {'data': json.dumps({'status': 'SUCCESS'})}]))
+        client = MagicMock(aclose=AsyncMock())
+        client.pubsub.return_value = pubsub
+        with patch('transcriber.progress.aioredis.Redis.from_url', return_value=client):
+            response = await AsyncClient().get(reverse('pipeline_events', args=[self.task.id]))
+            events = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(events, [b'data: {"status": "PROCESSING", "progress": 0, "current_step": null, "error_message": null}\n\n',
+                                  b': keep-alive\n\n', b'data: {"status": "SUCCESS"}\n\n'])
+        pubsub.aclose.assert_awaited_once()
+
+@patch('transcriber.views.enqueue_stage')
+class StageTaskTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media_root = tmp.name
+        settings = override_settings(MEDIA_ROOT=self.media_root, MEDIA_URL='/media/')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        for name, value in (('demucs', True), ('whisper', (True, 'Ready')), ('nnls', True), ('vamp', False), ('notes', True)):
+            patcher = patch(f'transcriber.views.{name}_available', return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_endpoints_queue_their_stage(self, mock_enqueue):
+        cases = [
+            ('extract_stems', 'stems', 'transcriber.tasks.separate_stage'),
+            ('transcribe_lyrics', 'lyrics', 'transcriber.tasks.transcribe_lyrics_stage'),
+            ('recognize_chords', 'chords', 'transcriber.tasks.recognize_chords_stage'),
+            ('transcribe_notes', 'notes', 'transcriber.tasks.transcribe_notes_stage'),
+        ]
+        for url, task_type, stage in cases:
+            with self.subTest(url=url):
+                mock_enqueue.reset_mock()
+                response = self.client.post(reverse(url), {'file_path': '/songs/song.wav', 'file_name': 'song.wav'})
+                self.assertEqual(response.status_code, 202)
+                task = TranscriptionTask.objects.get(id=response.json()['task_id'])
+                self.assertEqual((task.task_type, task.status, task.original_filename), (task_type, 'PENDING', 'song.wav'))
+                task_id, signature = mock_enqueue.call_args.args[:2]
+                self.assertEqual((task_id, signature.task), (str(task.id), stage))
+
+                # htmx gets a fragment that polls for the result
+                response = self.client.post(reverse(url), {'file_path': '/songs/song.wav'}, HTTP_HX_REQUEST='true')
+                self.assertEqual(response.status_code, 202)
+                self.assertContains(response, '/pipeline/result/', status_code=202)
+
+    def test_missing_file_path_is_not_queued(self, mock_enqueue):
+        for url in ('extract_stems', 'transcribe_lyrics', 'recognize_chords', 'transcribe_notes'):
+            self.assertEqual(self.client.post(reverse(url)).status_code, 400)
+        mock_enqueue.assert_not_called()
+        self.assertFalse(TranscriptionTask.objects.exists())
+
+    def result(self, task, htmx=False):
+        headers = {'HTTP_HX_REQUEST': 'true'} if htmx else {}
+        return self.client.get(reverse('pipeline_result', args=[task.id]), **headers)
+
+    def test_unfinished_and_failed_results(self, mock_enqueue):
+        pending = TranscriptionTask.objects.create(task_type='chords', status='PROCESSING', progress=40, current_step='Chords: beats')
+        response = self.result(pending, htmx=True)
+        self.assertContains(response, 'Chords: beats', status_code=202)
+        self.assertContains(response, f'/pipeline/result/{pending.id}/', status_code=202)
+        self.assertEqual(self.result(pending).status_code, 400)
+
+        failed = TranscriptionTask.objects.create(task_type='lyrics', status='FAILURE', error_message='Whisper crashed')
+        self.assertContains(self.result(failed, htmx=True), 'Lyrics Transcription failed: Whisper crashed')
+
+    def test_finished_results_per_type(self, mock_enqueue):
+        stems_dir = os.path.join(self.media_root, 'separated', 'htdemucs', 'key')
+        results = {
+            'stems': ({'vocals': os.path.join(stems_dir, 'vocals.wav'), 'no_vocals': os.path.join(stems_dir, 'no_vocals.wav')},
+                      {'vocals_url': '/media/separated/htdemucs/key/vocals.wav'}, 'separated/htdemucs/key/no_vocals.wav'),
+            'lyrics': ([{'start': 1.5, 'end': 3.0, 'text': 'hello world'}],
+                       {'lyrics': [{'start': 1.5, 'end': 3.0, 'text': 'hello world'}]}, 'hello world'),
+            'chords': ({'chords': [{'start': 0.0, 'end': 2.0, 'chord': 'Am7'}], 'algorithm': 'nnls'},
+                       {'chords': [{'start': 0.0, 'end': 2.0, 'chord': 'Am7'}], 'algorithm': 'nnls'}, 'Am7'),
+            'notes': ({'notes_id': 'abc', 'notes': [[0.0, 1.0, 60, 0.5, []]] * 3},
+                      {'note_count': 3, 'midi_url': '/media/notes_abc.mid'}, '3 notes'),
+        }
+        for task_type, (result, expected, html) in results.items():
+            with self.subTest(task_type=task_type):
+                task = TranscriptionTask.objects.create(task_type=task_type, status='SUCCESS', result_json=result)
+                data = self.result(task).json()
+                self.assertEqual(data['status'], 'success')
+                self.assertLessEqual(expected.items(), data.items())
+                self.assertContains(self.result(task, htmx=True), html)
+
+    def test_empty_stage_result_fails_the_task(self, mock_enqueue):
+        task = TranscriptionTask.objects.create(task_type='stems', status='PROCESSING')
+        with patch('transcriber.tasks.publish_progress'):
+            store_stage_result(None, str(task.id), 'Separation failed')
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.error_message, task.result_json), ('FAILURE', 'Separation failed', None))
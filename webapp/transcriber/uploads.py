@@ -0,0 +1,108 @@
+import os
+import uuid
+import hashlib
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from core.audio_cache import probe_audio, register_content_hash, unregister_content_hash
+
+SUPPORTED_EXTENSIONS = ('.mp3', '.wav', '.m4a', '.flac', '.ogg')
+
+def sniff_audio(head):
+    """True if the first bytes carry a known audio container signature."""
+    return (
+        (head[:4] == b'RIFF' and head[8:12] == b'WAVE')
+        or head[:4] in (b'fLaC', b'OggS')
+        or head[:3] == b'ID3'
+        or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0)  # MPEG frame sync
+        or head[4:8] == b'ftyp'  # MP4 / M4A
+    )
+
+class AudioUploadHandler(FileUploadHandler):
+    """
+    Streams an uploaded audio file straight into MEDIA_ROOT chunk by chunk, hashing it
+    and enforcing the size limit as the bytes arrive and checking the container
+    signature on the first chunk. When the upload completes, the header is probed for
+    duration/sample rate/channels and the hash is registered for downstream caches.
+    Rejections are left in .error for the view to report.
+    """
+    chunk_size = 1 << 20
+
+    def __init__(self, request=None, max_bytes=None, max_seconds=None):
+        super().__init__(request)
+        self.max_bytes = max_bytes or settings.UPLOAD_MAX_BYTES
+        self.max_seconds = max_seconds or settings.UPLOAD_MAX_SECONDS
+        self.error = None
+        self.upload = None
+        self._file = None
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        if field_name != 'audio' or self.upload is not None:
+            raise SkipFile()
+        ext = os.path.splitext(file_name)[1].lower()
+        if ext not in SUPPORTED_EXTENSIONS:
+            self.error = (415, f"Unsupported file type: {ext or 'none'}")
+            raise SkipFile()
+        self.path = os.path.join(settings.MEDIA_ROOT, f"{uuid.uuid4()}{ext}")
+        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+        self._file = open(f"{self.path}.part", 'wb')
+        self._digest = hashlib.sha256()
+        self._size = 0
+
+    def _reject(self, status, message):
+        self.error = (status, message)
+        self._discard()
+        raise SkipFile()
+
+    def _discard(self):
+        if self._file is not None:
+            self._file.close()
+            os.remove(self._file.name)
+            self._file = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self._file is None:
+            return raw_data
+        if start == 0 and not sniff_audio(raw_data[:12]):
+            self._reject(415, "File does not look like audio")
+        self._size += len(raw_data)
+        if self._size > self.max_bytes:
+            self._reject(413, f"File exceeds {self.max_bytes / 1024 ** 2:g} MB")
+        self._digest.update(raw_data)
+        self._file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self._file is None:
+            return None
+        self._file.close()
+        self._file = None
+        part_path = f"{self.path}.part"
+        info = probe_audio(part_path)
+        if info is None:
+            os.remove(part_path)
+            self.error = (415, "Unreadable or unsupported audio")
+            return None
+        if info['duration'] > self.max_seconds:
+            os.remove(part_path)
+            self.error = (413, f"Audio longer than {self.max_seconds / 60:g} minutes")
+            return None
+
+        os.replace(part_path, self.path)
+        digest = self._digest.hexdigest()
+        register_content_hash(self.path, digest)
+        self.upload = {'path': self.path, 'file_name': self.file_name, 'size': file_size,
+                       'content_hash': digest, **info}
+        return UploadedFile(open(self.path, 'rb'), name=os.path.basename(self.path),
+                            content_type=self.content_type, size=file_size)
+
+    def upload_interrupted(self):
+        self._discard()
+
+    def delete_upload(self):
+        """Removes a completed upload, and its hash record, that the view refused after all."""
+        if self.upload is not None:
+            unregister_content_hash(self.upload['path'])
+            os.remove(self.upload['path'])
+            self.upload = None
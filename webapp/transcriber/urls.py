@@ -10,8 +10,12 @@ urlpatterns = [
     path('lyrics/', views.transcribe_lyrics, name='transcribe_lyrics'),
     path('chords/', views.recognize_chords, name='recognize_chords'),
     path('notes/', views.transcribe_notes, name='transcribe_notes'),
+    path('notes/play/', views.play_notes, name='play_notes'),
     path('pipeline/start/', views.start_pipeline, name='start_pipeline'),
     path('pipeline/status/<uuid:task_id>/', views.pipeline_status, name='pipeline_status'),
+    path('pipeline/events/<uuid:task_id>/', views.pipeline_events, name='pipeline_events'),
+    path('pipeline/timings/<uuid:task_id>/', views.pipeline_timings, name='pipeline_timings'),
+    path('timings/', views.timings_summary, name='timings_summary'),
     path('pipeline/result/<uuid:task_id>/', views.pipeline_result, name='pipeline_result'),
 ]
 
@@ -1,19 +1,37 @@
 from django.shortcuts import render
-from django.http import JsonResponse
-from django.core.files.storage import FileSystemStorage
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, Max, Sum
+from django.utils import timezone
+from datetime import timedelta
 import os
 import uuid
 import json
 from pathlib import Path
-from core.basic_pitch_transcriber import basic_pitch_transcribe, is_available as notes_available
-from core.demucs_source_separator import demucs_source_separate, is_available as demucs_available
-from core.whisper_lyrics_transcriber import whisper_lyrics_transcribe, is_available as whisper_available
-from core.nnls_chord_transcriber import nnls_chord_transcribe, is_available as nnls_available
-from core.vamp_chord_transcriber import vamp_chord_transcribe, is_available as vamp_available
+from core.basic_pitch_transcriber import synthesize_notes
+from core.demucs_source_separator import DEMUCS_PRESETS
+from core.audio_cache import content_hash
+from core.capabilities import capability, refresh as refresh_capabilities
 
-from .models import TranscriptionTask
-from .tasks import process_audio_pipeline
+from .models import TranscriptionTask, TaskTiming
+from .progress import progress_events
+from .uploads import AudioUploadHandler
+from .tasks import (process_audio_pipeline, result_versions, enqueue_stage, separate_stage, transcribe_lyrics_stage,
+                    recognize_chords_stage, transcribe_notes_stage)
+
+# Multipart boundaries and headers around the audio file
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+RESULT_TEMPLATES = {
+    'pipeline': 'transcriber/partials/_pipeline_result.html',
+    'stems': 'transcriber/partials/_stems_result.html',
+    'lyrics': 'transcriber/partials/_lyrics_result.html',
+    'chords': 'transcriber/partials/_chords_result.html',
+    'notes': 'transcriber/partials/_notes_result.html',
+}
 
 def index(request):
     # Get available songs from data/songs directory
@@ -42,53 +60,107 @@ def list_songs(request):
                 })
     return JsonResponse({'songs': available_songs})
 
-def check_status(request):
-    return JsonResponse({
-        'stems': {'available': demucs_available(), 'msg': 'Demucs binary missing' if not demucs_available() else 'Ready'},
-        'lyrics': {'available': whisper_available()[0], 'msg': whisper_available()[1]},
-        'chords': {
-            'available': nnls_available() or vamp_available(), 
-            'msg': 'Ready',
-            'nnls': nnls_available(),
-            'vamp': vamp_available()
-        },
-        'notes': {'available': notes_available(), 'msg': 'Basic-pitch not installed' if not notes_available() else 'Ready'}
-    })
+# Backend availability comes from the cached capability registry (core/capabilities.py)
+def notes_available():
+    return capability('basic_pitch')
 
-def check_status_fragments(request):
-    status_map = {
+def demucs_available():
+    return capability('demucs')
+
+def whisper_available():
+    return capability('whisper')
+
+def nnls_available():
+    return capability('nnls')
+
+def vamp_available():
+    return capability('vamp')
+
+def chords_available():
+    return nnls_available() or vamp_available()
+
+def status_map(request):
+    if request.GET.get('refresh'):
+        refresh_capabilities()
+    lyrics_ok, lyrics_msg = whisper_available()
+    return {
         'stems': {'available': demucs_available(), 'msg': 'Demucs binary missing' if not demucs_available() else 'Ready'},
-        'lyrics': {'available': whisper_available()[0], 'msg': whisper_available()[1]},
+        'lyrics': {'available': lyrics_ok, 'msg': lyrics_msg},
         'chords': {'available': chords_available(), 'msg': 'Dependencies missing' if not chords_available() else 'Ready'},
         'notes': {'available': notes_available(), 'msg': 'Basic-pitch not installed' if not notes_available() else 'Ready'}
     }
-    return render(request, 'transcriber/partials/_status_alerts.html', {'status_map': status_map})
 
+def check_status(request):
+    statuses = status_map(request)
+    statuses['chords'].update({'msg': 'Ready', 'nnls': nnls_available(), 'vamp': vamp_available()})
+    return JsonResponse(statuses)
+
+def check_status_fragments(request):
+    return render(request, 'transcriber/partials/_status_alerts.html', {'status_map': status_map(request)})
+
+def demucs_options(params, prefix=''):
+    """Reads Demucs preset/threads/jobs/segment/overlap/shifts from request parameters."""
+    options = {'preset': params.get(f'{prefix}preset') or 'default'}
+    if options['preset'] not in DEMUCS_PRESETS:
+        raise ValueError(f"Unknown Demucs preset: {options['preset']}")
+    for name, cast in (('threads', int), ('jobs', int), ('segment', float), ('overlap', float), ('shifts', int)):
+        if params.get(f'{prefix}{name}'):
+            options[name] = cast(params[f'{prefix}{name}'])
+    return options
+
+@csrf_exempt
 def upload_audio(request):
-    if request.method == 'POST' and request.FILES.get('audio'):
-        audio_file = request.FILES['audio']
-        fs = FileSystemStorage()
-        ext = os.path.splitext(audio_file.name)[1]
-        filename = f"{uuid.uuid4()}{ext}"
-        filepath = fs.save(filename, audio_file)
-        
-        file_path = fs.path(filepath)
-        file_url = fs.url(filepath)
-        
-        if request.headers.get('HX-Request'):
-            return JsonResponse({
-                'status': 'success',
-                'file_url': file_url,
-                'file_path': file_path,
-                'file_name': audio_file.name
-            })
-            
-        return JsonResponse({
-            'status': 'success',
-            'file_url': file_url,
-            'file_path': file_path
-        })
-    return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
+    # Declared size is checked before a single body byte is read; the handler enforces the real one
+    if int(request.META.get('CONTENT_LENGTH') or 0) > settings.UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD:
+        return JsonResponse({'status': 'error', 'message': 'File too large'}, status=413)
+    # Upload handlers can only be swapped before the body is parsed, i.e. before the CSRF check
+    handler = AudioUploadHandler(request)
+    request.upload_handlers = [handler]
+    response = _upload_audio(request, handler)
+    if response.status_code == 403:
+        # The CSRF check read the form, so the file may already be stored: don't keep it
+        handler.delete_upload()
+    return response
+
+@csrf_protect
+def _upload_audio(request, handler):
+    # Parse the body here: with the token in a header, the CSRF check never read the form
+    audio = request.FILES.get('audio')
+    if handler.error:
+        status, message = handler.error
+        return JsonResponse({'status': 'error', 'message': message}, status=status)
+    if not audio or handler.upload is None:
+        return JsonResponse({'status': 'error', 'message': 'Invalid request'}, status=400)
+
+    upload = handler.upload
+    return JsonResponse({
+        'status': 'success',
+        'file_url': f"{settings.MEDIA_URL}{os.path.basename(upload['path'])}",
+        'file_path': upload['path'],
+        'file_name': upload['file_name'],
+        'content_hash': upload['content_hash'],
+        'duration': upload['duration'],
+        'sample_rate': upload['sample_rate'],
+        'channels': upload['channels']
+    })
+
+def media_url(path):
+    return f"{settings.MEDIA_URL}{Path(path).relative_to(Path(settings.MEDIA_ROOT)).as_posix()}"
+
+def queue_response(request, task):
+    """202 with the task id; htmx gets a fragment that polls pipeline_result."""
+    if request.headers.get('HX-Request'):
+        return render(request, 'transcriber/partials/_task_pending.html', {'task': task}, status=202)
+    return JsonResponse({'status': 'queued', 'task_id': str(task.id)}, status=202)
+
+def create_task(request, task_type, file_path):
+    return TranscriptionTask.objects.create(
+        task_type=task_type,
+        original_filename=request.POST.get('file_name') or os.path.basename(file_path),
+        audio_file_path=file_path
+    )
 
 def extract_stems(request):
     if not demucs_available():
@@ -98,21 +170,15 @@ def extract_stems(request):
     model_name = request.POST.get('model_name', 'htdemucs')
     if not file_path:
         return JsonResponse({'status': 'error', 'message': 'No file path provided'}, status=400)
+    try:
+        options = demucs_options(request.POST)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': f'Invalid Demucs settings: {e}'}, status=400)
     
-    stems = demucs_source_separate(file_path, settings.MEDIA_ROOT, model_name=model_name)
-    if stems:
-        filename_stem = Path(file_path).stem
-        context = {
-            'vocals_url': f"{settings.MEDIA_URL}separated/{model_name}/{filename_stem}/vocals.wav",
-            'no_vocals_url': f"{settings.MEDIA_URL}separated/{model_name}/{filename_stem}/no_vocals.wav",
-            'vocals_path': stems['vocals'],
-            'no_vocals_path': stems['no_vocals']
-        }
-        if request.headers.get('HX-Request'):
-            return render(request, 'transcriber/partials/_stems_result.html', context)
-        return JsonResponse({'status': 'success', **context})
-
-    return JsonResponse({'status': 'error', 'message': 'Separation failed'}, status=500)
+    task = create_task(request, 'stems', file_path)
+    enqueue_stage(str(task.id), separate_stage.s(str(task.id), {'model_name': model_name, **options}),
+                  "Separating audio sources...", 'Separation failed')
+    return queue_response(request, task)
 
 def transcribe_lyrics(request):
     available, msg = whisper_available()
@@ -125,12 +191,10 @@ def transcribe_lyrics(request):
     if not file_path:
         return JsonResponse({'status': 'error', 'message': 'No file path provided'}, status=400)
     
-    lyrics = whisper_lyrics_transcribe(file_path, settings.MEDIA_ROOT, model_name=model_name, language=language)
-    if lyrics:
-        if request.headers.get('HX-Request'):
-            return render(request, 'transcriber/partials/_lyrics_result.html', {'lyrics': lyrics})
-        return JsonResponse({'status': 'success', 'lyrics': lyrics})
-    return JsonResponse({'status': 'error', 'message': 'Transcription failed'}, status=500)
+    task = create_task(request, 'lyrics', file_path)
+    enqueue_stage(str(task.id), transcribe_lyrics_stage.s(file_path, language, model_name, task_id=str(task.id)),
+                  f"Transcribing lyrics ({language})...", 'Transcription failed')
+    return queue_response(request, task)
 
 def recognize_chords(request):
     file_path = request.POST.get('file_path')
@@ -139,22 +203,18 @@ def recognize_chords(request):
     if not file_path:
         return JsonResponse({'status': 'error', 'message': 'No file path provided'}, status=400)
     
-    chords = None
     if algorithm == 'vamp':
         if not vamp_available():
             return JsonResponse({'status': 'error', 'message': 'Vamp/Chordino is not installed.'}, status=412)
-        chords = vamp_chord_transcribe(file_path)
     else: # Default/NNLS
         if not nnls_available():
             return JsonResponse({'status': 'error', 'message': 'NNLS dependencies missing.'}, status=412)
-        chords = nnls_chord_transcribe(file_path)
+        algorithm = 'nnls'
     
-    if chords is not None:
-        if request.headers.get('HX-Request'):
-            return render(request, 'transcriber/partials/_chords_result.html', {'chords': chords, 'algorithm': algorithm})
-        return JsonResponse({'status': 'success', 'chords': chords, 'algorithm': algorithm})
-    
-    return JsonResponse({'status': 'error', 'message': f'Chord recognition ({algorithm}) failed'}, status=500)
+    task = create_task(request, 'chords', file_path)
+    enqueue_stage(str(task.id), recognize_chords_stage.s(file_path, algorithm, task_id=str(task.id)),
+                  f"Recognizing chords ({algorithm})...", f'Chord recognition ({algorithm}) failed')
+    return queue_response(request, task)
 
 def transcribe_notes(request):
     if not notes_available():
@@ -164,15 +224,54 @@ def transcribe_notes(request):
     if not file_path:
         return JsonResponse({'status': 'error', 'message': 'No file path provided'}, status=400)
     
-    output_filename = f"notes_{uuid.uuid4()}.wav"
+    task = create_task(request, 'notes', file_path)
+    enqueue_stage(str(task.id), transcribe_notes_stage.s(file_path, str(uuid.uuid4()), task_id=str(task.id)),
+                  "Transcribing notes...", 'Note Transcription failed')
+    return queue_response(request, task)
+
+def result_context(task):
+    """Template context for a finished task, matching what each tab's partial expects."""
+    result = task.result_json
+    if task.task_type == 'stems':
+        return {
+            'vocals_url': media_url(result['vocals']),
+            'no_vocals_url': media_url(result['no_vocals']),
+            'vocals_path': result['vocals'],
+            'no_vocals_path': result['no_vocals']
+        }
+    if task.task_type == 'lyrics':
+        return {'lyrics': result}
+    if task.task_type == 'chords':
+        return {'chords': result['chords'], 'algorithm': result['algorithm']}
+    if task.task_type == 'notes':
+        # Stored note events only; audio is rendered by play_notes if someone listens
+        notes_id = result['notes_id']
+        return {
+            'notes_id': notes_id,
+            'notes': result['notes'],
+            'note_count': len(result['notes']),
+            'notes_array_url': f"{settings.MEDIA_URL}notes_{notes_id}.npy",
+            'midi_url': f"{settings.MEDIA_URL}notes_{notes_id}.mid",
+        }
+    return {'result': result}
+
+def play_notes(request):
+    try:
+        notes_id = uuid.UUID(request.POST.get('notes_id', ''))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid notes id'}, status=400)
+
+    notes_path = os.path.join(settings.MEDIA_ROOT, f"notes_{notes_id}.npy")
+    output_filename = f"notes_{notes_id}.wav"
     output_path = os.path.join(settings.MEDIA_ROOT, output_filename)
-    result_path = basic_pitch_transcribe(file_path, output_path)
-    if result_path:
+    if not os.path.exists(notes_path):
+        return JsonResponse({'status': 'error', 'message': 'Notes not found'}, status=404)
+    if os.path.exists(output_path) or synthesize_notes(notes_path, output_path):
         context = {'notes_url': f"{settings.MEDIA_URL}{output_filename}"}
         if request.headers.get('HX-Request'):
-            return render(request, 'transcriber/partials/_notes_result.html', context)
+            return render(request, 'transcriber/partials/_notes_audio.html', context)
         return JsonResponse({'status': 'success', **context})
-    return JsonResponse({'status': 'error', 'message': 'Note Transcription failed'}, status=500)
+    return JsonResponse({'status': 'error', 'message': 'Nothing to play'}, status=500)
 
 def start_pipeline(request):
     file_path = request.POST.get('file_path')
@@ -182,37 +281,150 @@ def start_pipeline(request):
     
     chord_algorithm = request.POST.get('chord_algorithm', 'madmom')
     language = request.POST.get('language', 'zh')
+    try:
+        options = demucs_options(request.POST, prefix='demucs_')
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': f'Invalid Demucs settings: {e}'}, status=400)
+    if not os.path.exists(file_path):
+        return JsonResponse({'status': 'error', 'message': 'File not found'}, status=400)
     
-    task = TranscriptionTask.objects.create(
-        original_filename=file_name,
-        audio_file_path=file_path
-    )
-    process_audio_pipeline.delay(str(task.id), chord_algorithm=chord_algorithm, language=language)
+    # Anything but an available Vamp ends up as NNLS in recognize_chords
+    algorithm_key = 'vamp' if chord_algorithm == 'vamp' and vamp_available() else 'nnls'
+    dedup_key = {
+        'content_hash': content_hash(file_path),
+        'chord_algorithm': algorithm_key,
+        'language': language,
+        'versions': result_versions(options),
+    }
+    task, created = claim_pipeline_task(dedup_key, original_filename=file_name, audio_file_path=file_path)
+    if not created:
+        return JsonResponse({
+            'status': 'success',
+            'task_id': str(task.id),
+            'deduplicated': True
+        })
+    
+    process_audio_pipeline.delay(str(task.id), chord_algorithm=chord_algorithm, language=language, demucs_options=options)
     
     return JsonResponse({
         'status': 'success',
         'task_id': str(task.id)
     })
 
+def claim_pipeline_task(dedup_key, **fields):
+    """
+    Returns (task, created): an existing task for dedup_key (see find_pipeline_task) or a
+    new one. The unique constraint on unfinished tasks settles simultaneous requests: the
+    one that loses the insert attaches to the winner's task.
+    """
+    # In-flight tasks past the timeout are presumed lost with their worker; release the key
+    started_before = timezone.now() - timedelta(seconds=settings.PIPELINE_DEDUP_INFLIGHT_TIMEOUT)
+    TranscriptionTask.objects.filter(task_type='pipeline', status__in=['PENDING', 'PROCESSING'],
+                                     created_at__lt=started_before, **dedup_key) \
+        .update(status='FAILURE', error_message='Timed out', updated_at=timezone.now())
+    existing = find_pipeline_task(**dedup_key)
+    if existing:
+        return existing, False
+    try:
+        with transaction.atomic():
+            return TranscriptionTask.objects.create(**dedup_key, **fields), True
+    except IntegrityError:
+        # An identical request created its task since we looked
+        existing = find_pipeline_task(**dedup_key)
+        if existing is None:
+            raise
+        return existing, False
+
+def find_pipeline_task(**dedup_key):
+    """
+    A finished pipeline task with the same key (its result is reused as is) or, failing
+    that, a recent in-flight one to attach to. Failed tasks are never reused.
+    """
+    matches = TranscriptionTask.objects.filter(task_type='pipeline', **dedup_key).order_by('-created_at')
+    finished = matches.filter(status='SUCCESS').first()
+    if finished:
+        return finished
+    started_after = timezone.now() - timedelta(seconds=settings.PIPELINE_DEDUP_INFLIGHT_TIMEOUT)
+    return matches.filter(status__in=['PENDING', 'PROCESSING'], created_at__gte=started_after).first()
+
 def pipeline_status(request, task_id):
     try:
         task = TranscriptionTask.objects.get(id=task_id)
-        return JsonResponse({
-            'status': task.status,
-            'progress': task.progress,
-            'current_step': task.current_step,
-            'error_message': task.error_message
-        })
+        return JsonResponse(task_state(task))
+    except TranscriptionTask.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Task not found'}, status=404)
+
+def task_state(task):
+    return {
+        'status': task.status,
+        'progress': task.progress,
+        'current_step': task.current_step,
+        'error_message': task.error_message
+    }
+
+def pipeline_events(request, task_id):
+    """
+    Server-Sent Events stream of a task's progress, fed by Redis pub/sub instead of
+    polling pipeline_status. Only served under ASGI: a WSGI worker would stay blocked
+    for the whole task, so there the client is told (204) to poll instead.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)  # EventSource gives up without reconnecting
+    try:
+        task = TranscriptionTask.objects.get(id=task_id)
     except TranscriptionTask.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'Task not found'}, status=404)
 
+    async def snapshot():
+        await task.arefresh_from_db(fields=['status', 'progress', 'current_step', 'error_message'])
+        return task_state(task)
+
+    response = StreamingHttpResponse(progress_events(task_id, snapshot), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def pipeline_timings(request, task_id):
+    """Timing spans recorded for one task, plus per-stage and per-span totals in seconds."""
+    if not TranscriptionTask.objects.filter(id=task_id).exists():
+        return JsonResponse({'status': 'error', 'message': 'Task not found'}, status=404)
+    spans = list(TaskTiming.objects.filter(task_id=task_id).order_by('stage', 'start')
+                 .values('stage', 'name', 'start', 'duration', 'depth'))
+    totals = {}
+    for s in spans:
+        if s['depth'] > 0:
+            totals[s['name']] = totals.get(s['name'], 0.0) + s['duration']
+    return JsonResponse({
+        'task_id': str(task_id),
+        'stages': {s['stage']: s['duration'] for s in spans if s['depth'] == 0},
+        'totals': totals,
+        'spans': spans
+    })
+
+def timings_summary(request):
+    """Span statistics across all recorded tasks (optionally ?stage=chords), slowest first."""
+    timings = TaskTiming.objects.all()
+    if request.GET.get('stage'):
+        timings = timings.filter(stage=request.GET['stage'])
+    rows = timings.values('stage', 'name').annotate(
+        count=Count('id'), total=Sum('duration'), mean=Avg('duration'), max=Max('duration')).order_by('-total')
+    return JsonResponse({'spans': list(rows)})
+
 def pipeline_result(request, task_id):
     try:
         task = TranscriptionTask.objects.get(id=task_id)
+        is_htmx = request.headers.get('HX-Request')
+        if task.status == 'FAILURE' and is_htmx:
+            return render(request, 'transcriber/partials/_task_failed.html', {'task': task})
         if task.status != 'SUCCESS':
+            if is_htmx:
+                return render(request, 'transcriber/partials/_task_pending.html', {'task': task}, status=202)
             return JsonResponse({'status': 'error', 'message': 'Task not finished'}, status=400)
         
-        return render(request, 'transcriber/partials/_pipeline_result.html', {'task': task, 'result': task.result_json})
+        context = result_context(task)
+        if task.task_type != 'pipeline' and not is_htmx:
+            return JsonResponse({'status': 'success', **context})
+        return render(request, RESULT_TEMPLATES[task.task_type], {'task': task, **context})
     except TranscriptionTask.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'Task not found'}, status=404)
 